@@ -5,21 +5,25 @@ Handles document upload, retrieval, and management operations.
 """
 
 import os
+import asyncio
+import shutil
 import hashlib
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import List, Optional
+from functools import lru_cache
+from typing import BinaryIO, List, Optional
 
 from fastapi import (
     APIRouter, Depends, HTTPException, UploadFile, File, Form,
-    Query, BackgroundTasks
+    Query, BackgroundTasks, Response
 )
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, desc
 
 from app.core.database import get_db
 from app.core.config import get_settings
+from app.core.vector_store import delete_document_embeddings
 from app.models.document import (
     Document, DocumentResponse, DocumentCreate, DocumentUpdate,
     DocumentStats, DocumentStatus
@@ -30,9 +34,41 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Uploads are hashed and copied to storage in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20
 
-def get_document_processor():
-    """Dependency to get document processor instance"""
+
+def _spooled_size(fileobj: BinaryIO) -> int:
+    """Size of a spooled upload, found by seeking rather than reading"""
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    return size
+
+
+def _hash_upload(fileobj: BinaryIO) -> str:
+    """SHA-256 of a spooled upload, streamed in chunks"""
+    sha256_hash = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(UPLOAD_CHUNK_SIZE), b""):
+        sha256_hash.update(chunk)
+    fileobj.seek(0)
+    return sha256_hash.hexdigest()
+
+
+def _save_upload(fileobj: BinaryIO, file_path: Path) -> None:
+    """Copy a spooled upload to storage in chunks"""
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(fileobj, f, UPLOAD_CHUNK_SIZE)
+    fileobj.seek(0)
+
+
+@lru_cache()
+def get_document_processor() -> DocumentProcessor:
+    """Dependency to get the shared document processor instance
+    
+    Building the Docling converter is CPU-heavy, so it is constructed once
+    rather than on the event loop for every upload.
+    """
     return DocumentProcessor()
 
 
@@ -62,18 +98,17 @@ async def upload_document(
             detail=f"File type '{file_ext}' not supported. Allowed: {settings.allowed_extensions}"
         )
     
-    # Read file content
-    content = await file.read()
-    
-    # Check file size
-    if len(content) > settings.max_file_size:
+    # Check file size. The upload is already spooled by the server, so it is
+    # measured, hashed and saved in chunks instead of being read into memory
+    file_size = await asyncio.to_thread(_spooled_size, file.file)
+    if file_size > settings.max_file_size:
         raise HTTPException(
             status_code=413,
             detail=f"File too large. Maximum size: {settings.max_file_size / 1024 / 1024:.1f}MB"
         )
     
     # Calculate file hash for deduplication
-    file_hash = hashlib.sha256(content).hexdigest()
+    file_hash = await asyncio.to_thread(_hash_upload, file.file)
     
     # Check for duplicate
     existing_doc = await db.execute(
@@ -94,9 +129,8 @@ async def upload_document(
         # Ensure upload directory exists
         settings.upload_path.mkdir(exist_ok=True)
         
-        # Save file
-        with open(file_path, "wb") as f:
-            f.write(content)
+        # Save file off the event loop
+        await asyncio.to_thread(_save_upload, file.file, file_path)
         
         # Parse metadata if provided
         doc_metadata = {}
@@ -112,7 +146,7 @@ async def upload_document(
             filename=safe_filename,
             original_filename=file.filename,
             file_path=str(file_path),
-            file_size=len(content),
+            file_size=file_size,
             file_hash=file_hash,
             content_type=file.content_type,
             metadata=doc_metadata
@@ -138,8 +172,8 @@ async def upload_document(
     except Exception as e:
         logger.error(f"Document upload failed: {e}")
         # Clean up file if database operation failed
-        if 'file_path' in locals() and Path(file_path).exists():
-            os.remove(file_path)
+        if 'file_path' in locals():
+            await asyncio.to_thread(Path(file_path).unlink, missing_ok=True)
         raise HTTPException(status_code=500, detail="Upload failed")
 
 
@@ -240,6 +274,27 @@ async def get_document(
     return DocumentResponse(**document.to_dict())
 
 
+@router.head("/documents/{document_id}")
+async def get_document_status(
+    document_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """Report a document's processing status in the X-Doc-Status header.
+    
+    Lets clients poll for completion without serializing the full document.
+    """
+    
+    result = await db.execute(
+        select(Document.status).where(Document.id == document_id)
+    )
+    status = result.scalar_one_or_none()
+    
+    if status is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    return Response(headers={"X-Doc-Status": str(status)})
+
+
 @router.put("/documents/{document_id}", response_model=DocumentResponse)
 async def update_document(
     document_id: int,
@@ -286,9 +341,8 @@ async def delete_document(
     
     # Delete file from storage
     try:
-        file_path = Path(document.file_path)
-        if file_path.exists():
-            file_path.unlink()
+        # Unlink off the event loop; a missing file is not an error
+        await asyncio.to_thread(Path(document.file_path).unlink, missing_ok=True)
     except Exception as e:
         logger.warning(f"Could not delete file {document.file_path}: {e}")
     
@@ -296,6 +350,13 @@ async def delete_document(
     await db.delete(document)
     await db.commit()
     
+    # Foreign keys are not enforced, so chunk embeddings, vectors and the
+    # SimHash sketch are removed explicitly; otherwise they crowd vector search
+    try:
+        await delete_document_embeddings(document_id)
+    except Exception as e:
+        logger.warning(f"Could not delete embeddings for document {document_id}: {e}")
+    
     return {"message": "Document deleted successfully"}
 
 
@@ -36,6 +36,7 @@ class Settings(BaseSettings):
     upload_dir: str = os.getenv("UPLOAD_PATH", "./uploads")
     max_file_size: int = 50 * 1024 * 1024  # 50MB
     allowed_extensions: List[str] = ["pdf", "docx", "txt", "xlsx", "csv"]
+    doc_concurrency: int = 4  # Documents processed in parallel by batch processing
     
     # Security
     secret_key: str = "your-secret-key-change-in-production"
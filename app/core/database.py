@@ -11,7 +11,7 @@ from typing import Optional, AsyncGenerator
 from contextlib import asynccontextmanager
 
 import aiosqlite
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base, sessionmaker
 
@@ -39,6 +39,25 @@ async_engine = create_async_engine(
     echo=settings.debug,
 )
 
+
+# Per-connection PRAGMAs for the ORM engines. In WAL mode synchronous=NORMAL
+# only fsyncs at checkpoints instead of on every commit, and stays crash-safe
+SQLITE_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Apply SQLITE_CONNECTION_PRAGMAS to each new DBAPI connection"""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_CONNECTION_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
 # Session makers
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 AsyncSessionLocal = async_sessionmaker(
@@ -48,6 +67,14 @@ AsyncSessionLocal = async_sessionmaker(
 )
 
 
+# Long-lived connection shared by execute_raw_sql. sqlite3 keeps an LRU of
+# prepared statements per connection, so the identical tool queries are
+# parsed once instead of on every call.
+RAW_SQL_STATEMENT_CACHE = 256
+_raw_db: Optional[aiosqlite.Connection] = None
+_raw_db_lock: Optional[asyncio.Lock] = None
+
+
 async def init_database() -> None:
     """Initialize database with tables and FTS5 setup"""
     logger.info("Initializing database...")
@@ -72,6 +99,9 @@ async def _init_sqlite_features() -> None:
         # Enable foreign keys
         await db.execute("PRAGMA foreign_keys = ON")
         
+        # WAL lets the shared read connection run alongside writers
+        await db.execute("PRAGMA journal_mode = WAL")
+        
         # Create FTS5 search table for full-text search
         await db.execute("""
             CREATE VIRTUAL TABLE IF NOT EXISTS document_search USING fts5(
@@ -112,6 +142,12 @@ async def _init_sqlite_features() -> None:
             END
         """)
         
+        # Covering index for hash-based duplicate lookups (rowid id is implicit)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_documents_hash_time
+            ON documents(file_hash, uploaded_at DESC, filename, file_size, status)
+        """)
+        
         await db.commit()
         logger.info("✅ FTS5 search index initialized")
 
@@ -156,27 +192,79 @@ async def test_database_connection() -> bool:
         return False
 
 
+def _dict_row_factory(cursor: sqlite3.Cursor, row: tuple) -> dict:
+    """Build result dicts in the connection thread instead of on the event loop"""
+    return dict(zip([column[0] for column in cursor.description], row))
+
+
+async def _get_raw_connection() -> aiosqlite.Connection:
+    """Open the shared execute_raw_sql connection on first use"""
+    global _raw_db, _raw_db_lock
+    if _raw_db is not None:
+        return _raw_db
+    
+    # Created lazily so the lock binds to the running event loop
+    if _raw_db_lock is None:
+        _raw_db_lock = asyncio.Lock()
+    
+    async with _raw_db_lock:
+        if _raw_db is None:
+            connection = aiosqlite.connect(
+                settings.database_path,
+                cached_statements=RAW_SQL_STATEMENT_CACHE
+            )
+            # aiosqlite's worker thread is non-daemon, so a caller that never
+            # reaches close_raw_connection() would hang at interpreter exit.
+            # The connection only serves reads, so letting exit stop it is safe.
+            # (The worker is the connection itself before aiosqlite 0.21.)
+            getattr(connection, "_thread", connection).daemon = True
+            db = await connection
+            # Rows come back as plain dicts, decoded once at fetch time
+            db.row_factory = _dict_row_factory
+            await db.execute("PRAGMA cache_size = -65536")  # 64 MB page cache
+            await db.execute("PRAGMA temp_store = MEMORY")
+            await db.execute("PRAGMA mmap_size = 268435456")  # 256 MB memory map
+            _raw_db = db
+    return _raw_db
+
+
+async def close_raw_connection() -> None:
+    """Close the shared execute_raw_sql connection"""
+    global _raw_db
+    if _raw_db is not None:
+        db, _raw_db = _raw_db, None
+        await db.close()
+
+
 async def execute_raw_sql(query: str, params=None) -> list:
-    """Execute raw SQL query with optional parameters (list/tuple or dict)"""
-    async with aiosqlite.connect(settings.database_path) as db:
-        # Set row factory to get dictionary-like rows
-        db.row_factory = aiosqlite.Row
-        
-        if params:
-            cursor = await db.execute(query, params)
-        else:
-            cursor = await db.execute(query)
-        
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows] if rows else []
+    """Execute raw SQL query with optional parameters (list/tuple or dict)
+    
+    Runs on a shared connection opened on first use. Long-running processes
+    should await close_raw_connection() on shutdown, as main.py's lifespan
+    and mcp_server.main() do. Standalone scripts can skip it and still exit,
+    because the connection's worker thread is a daemon.
+    """
+    db = await _get_raw_connection()
+    
+    # Execute and fetch in a single hop to the connection thread
+    return list(await db.execute_fetchall(query, params or ()))
 
 
-async def search_documents_fts5(search_term: str, limit: int = 50) -> list:
-    """Search documents using FTS5 full-text search"""
+async def search_documents_fts5(
+    search_term: str,
+    limit: int = 50,
+    highlight_start: str = "<mark>",
+    highlight_end: str = "</mark>"
+) -> list:
+    """Search documents using FTS5 full-text search
+    
+    Matches in the snippet are wrapped with highlight_start/highlight_end
+    by FTS5 itself, so callers needing other markup avoid rewriting it.
+    """
     query = """
         SELECT 
             d.id, d.filename, d.file_size, d.uploaded_at, d.content_type,
-            snippet(document_search, 2, '<mark>', '</mark>', '...', 20) as snippet,
+            snippet(document_search, 2, ?, ?, '...', 20) as snippet,
             rank as relevance_score
         FROM document_search 
         JOIN documents d ON d.id = document_search.rowid
@@ -185,4 +273,4 @@ async def search_documents_fts5(search_term: str, limit: int = 50) -> list:
         LIMIT ?
     """
     
-    return await execute_raw_sql(query, (search_term, limit))
\ No newline at end of file
+    return await execute_raw_sql(query, (highlight_start, highlight_end, search_term, limit))
\ No newline at end of file
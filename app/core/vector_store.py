@@ -1,19 +1,29 @@
 """
 Vector store implementation for document embeddings
 Uses sentence-transformers for generating embeddings
-Stores vectors in SQLite with JSON for simple vector similarity search
+Stores vectors in SQLite as float16 blobs, indexed by a sqlite-vec vec0 table for
+KNN search when the extension can be loaded
 """
 
+import re
 import json
+import asyncio
 import hashlib
 import logging
 import numpy as np
+import orjson
+from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
 import aiosqlite
 from sentence_transformers import SentenceTransformer
 
+try:
+    import sqlite_vec
+except ImportError:
+    sqlite_vec = None
+
 from app.core.config import get_settings
 from app.core.database import execute_raw_sql
 
@@ -23,14 +33,41 @@ settings = get_settings()
 # Initialize the embedding model
 # Using a lightweight but effective model for document embeddings
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_DIMENSIONS = 384
 embedding_model = None
 
+# Weights fetched by download_models.py, so the server loads them from disk
+EMBEDDING_MODEL_CACHE = Path(__file__).resolve().parents[2] / "model_cache"
+
+# Chunk embeddings are persisted as raw half-precision bytes
+EMBEDDING_STORAGE_DTYPE = np.float16
+
+# sqlite-vec KNN index over document_embeddings (rowid = document_embeddings.id)
+# Candidates are found on int8-quantized vectors, then re-ranked on the float32 copy
+VEC_TABLE = "document_embeddings_vec"
+VEC_RERANK_FACTOR = 4
+VEC_KNN_MAX_K = 4096  # largest k sqlite-vec accepts in a KNN query
+vec_enabled = False
+
+# SimHash sketches over word shingles, used to shortlist duplicate candidates
+SIMHASH_BITS = 64
+SIMHASH_SHINGLE_SIZE = 3
+
+# Documents embedded together in update_all_embeddings, chunks per encode micro-batch,
+# and how many micro-batches may be encoded at once
+DEFAULT_EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_ENCODE_BATCH_SIZE = 64
+EMBEDDING_CONCURRENCY = 4
+
 def get_embedding_model():
     """Get or initialize the embedding model"""
     global embedding_model
     if embedding_model is None:
         logger.info(f"Loading embedding model: {EMBEDDING_MODEL}")
-        embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+        embedding_model = SentenceTransformer(EMBEDDING_MODEL, cache_folder=str(EMBEDDING_MODEL_CACHE))
+        # Half-precision weights halve memory traffic on GPU; CPU kernels stay fp32
+        if embedding_model.device.type == "cuda":
+            embedding_model.half()
     return embedding_model
 
 
@@ -63,6 +100,195 @@ def generate_chunk_hash(document_id: int, chunk_index: int, chunk_text: str) ->
     return hashlib.sha256(combined.encode('utf-8')).hexdigest()
 
 
+def compute_simhash(text: str, shingle_size: int = SIMHASH_SHINGLE_SIZE) -> int:
+    """
+    Compute a 64-bit SimHash over word shingles of the normalized text
+    
+    Args:
+        text: Text to sketch
+        shingle_size: Number of words per shingle
+    
+    Returns:
+        Fingerprint as a signed 64-bit integer (SQLite INTEGER range)
+    """
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return 0
+    
+    shingles = [
+        " ".join(words[i:i + shingle_size])
+        for i in range(max(1, len(words) - shingle_size + 1))
+    ]
+    hashes = np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+            for shingle in shingles
+        ),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+    
+    # Each fingerprint bit is set when most shingle hashes have that bit set
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    fingerprint = np.packbits(majority, bitorder='little').view(np.int64)[0]
+    return int(fingerprint)
+
+
+def simhash_distance(hash1: int, hash2: int) -> int:
+    """Hamming distance between two SimHash fingerprints"""
+    return bin((hash1 ^ hash2) & ((1 << SIMHASH_BITS) - 1)).count("1")
+
+
+async def load_vec_extension(db: aiosqlite.Connection) -> bool:
+    """
+    Load the sqlite-vec extension into a connection
+    
+    Args:
+        db: Open aiosqlite connection
+    
+    Returns:
+        True if the extension was loaded, False if it is unavailable
+    """
+    if sqlite_vec is None:
+        return False
+    
+    try:
+        await db.enable_load_extension(True)
+        await db.load_extension(sqlite_vec.loadable_path())
+        await db.enable_load_extension(False)
+        return True
+    except Exception as e:
+        # Some Python builds are compiled without loadable extension support
+        logger.warning(f"Could not load sqlite-vec extension: {e}")
+        return False
+
+
+def quantize_int8(embedding: np.ndarray) -> bytes:
+    """
+    Quantize an embedding to int8 with a per-vector scale
+    
+    Cosine distance is scale invariant, so the scale does not need to be stored.
+    
+    Args:
+        embedding: Float embedding vector
+    
+    Returns:
+        Packed int8 bytes suitable for a vec0 int8 column
+    """
+    vec = np.asarray(embedding, dtype=np.float32)
+    scale = float(np.max(np.abs(vec))) / 127 or 1.0
+    return np.clip(np.round(vec / scale), -127, 127).astype(np.int8).tobytes()
+
+
+def encode_embedding(embedding: np.ndarray) -> bytes:
+    """Pack an embedding as float16 bytes for document_embeddings.embedding"""
+    return np.asarray(embedding, dtype=EMBEDDING_STORAGE_DTYPE).tobytes()
+
+
+def decode_embedding(value) -> np.ndarray:
+    """
+    Unpack a stored embedding into a float32 vector
+    
+    Args:
+        value: float16 bytes, or a JSON array written before the blob format
+    
+    Returns:
+        float32 embedding vector
+    """
+    if isinstance(value, str):
+        return np.asarray(json.loads(value), dtype=np.float32)
+    return np.frombuffer(value, dtype=EMBEDDING_STORAGE_DTYPE).astype(np.float32)
+
+
+async def _migrate_json_embeddings(db: aiosqlite.Connection) -> None:
+    """Convert embeddings stored as JSON text to float16 blobs"""
+    cursor = await db.execute(
+        "SELECT id, embedding FROM document_embeddings WHERE typeof(embedding) = 'text'"
+    )
+    rows = await cursor.fetchall()
+    if rows:
+        await db.executemany(
+            "UPDATE document_embeddings SET embedding = ? WHERE id = ?",
+            [(encode_embedding(decode_embedding(embedding)), row_id) for row_id, embedding in rows]
+        )
+        logger.info(f"Converted {len(rows)} JSON embeddings to float16 blobs")
+
+
+async def _init_vec_table(db: aiosqlite.Connection) -> None:
+    """Create the vec0 index, rebuilding it if the schema predates int8 vectors"""
+    cursor = await db.execute(
+        "SELECT sql FROM sqlite_master WHERE name = ?", (VEC_TABLE,)
+    )
+    existing = await cursor.fetchone()
+    if existing and "embedding_q" not in existing[0]:
+        logger.info(f"Rebuilding {VEC_TABLE} with int8 quantized vectors")
+        await db.execute(f"DROP TABLE {VEC_TABLE}")
+    
+    await db.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {VEC_TABLE} USING vec0(
+            embedding_q int8[{EMBEDDING_DIMENSIONS}] distance_metric=cosine,
+            embedding float[{EMBEDDING_DIMENSIONS}]
+        )
+    """)
+    
+    # Drop vectors whose embedding row is gone; processes without the extension
+    # delete document_embeddings rows without touching the vec0 table
+    cursor = await db.execute(f"""
+        DELETE FROM {VEC_TABLE}
+        WHERE rowid NOT IN (SELECT id FROM document_embeddings)
+    """)
+    if cursor.rowcount > 0:
+        logger.info(f"Pruned {cursor.rowcount} orphaned vectors from {VEC_TABLE}")
+    
+    # Index any embeddings stored before the vec0 table existed
+    cursor = await db.execute(f"""
+        SELECT id, embedding FROM document_embeddings
+        WHERE id NOT IN (SELECT rowid FROM {VEC_TABLE})
+    """)
+    rows = await cursor.fetchall()
+    if rows:
+        vectors = [decode_embedding(embedding) for _, embedding in rows]
+        await db.executemany(
+            f"INSERT INTO {VEC_TABLE}(rowid, embedding_q, embedding) VALUES (?, vec_int8(?), ?)",
+            [(row[0], quantize_int8(vec), vec.tobytes()) for row, vec in zip(rows, vectors)]
+        )
+        logger.info(f"Indexed {len(rows)} existing embeddings in {VEC_TABLE}")
+
+
+async def _prune_deleted_documents(db: aiosqlite.Connection) -> None:
+    """Remove embeddings and sketches left behind by deleted documents"""
+    cursor = await db.execute(
+        "DELETE FROM document_embeddings WHERE document_id NOT IN (SELECT id FROM documents)"
+    )
+    if cursor.rowcount > 0:
+        logger.info(f"Pruned {cursor.rowcount} embeddings of deleted documents")
+    await db.execute(
+        "DELETE FROM document_sketches WHERE document_id NOT IN (SELECT id FROM documents)"
+    )
+
+
+async def _backfill_sketches(db: aiosqlite.Connection) -> None:
+    """Compute SimHash sketches for embedded documents stored before sketches existed"""
+    cursor = await db.execute("""
+        SELECT d.id, d.content
+        FROM documents d
+        WHERE d.content IS NOT NULL
+          AND EXISTS (SELECT 1 FROM document_embeddings de WHERE de.document_id = d.id)
+          AND NOT EXISTS (SELECT 1 FROM document_sketches s WHERE s.document_id = d.id)
+    """)
+    rows = await cursor.fetchall()
+    if rows:
+        sketches = await asyncio.to_thread(
+            lambda: [(document_id, compute_simhash(content)) for document_id, content in rows]
+        )
+        await db.executemany(
+            "INSERT OR REPLACE INTO document_sketches (document_id, simhash) VALUES (?, ?)",
+            sketches
+        )
+        logger.info(f"Backfilled SimHash sketches for {len(rows)} documents")
+
+
 async def init_vector_store():
     """Initialize vector store tables in SQLite with enhanced JSON storage"""
     create_table_query = """
@@ -72,7 +298,7 @@ async def init_vector_store():
         chunk_index INTEGER NOT NULL,
         chunk_hash TEXT NOT NULL,  -- SHA-256 hash of chunk
         chunk_text TEXT NOT NULL,
-        embedding JSON NOT NULL,  -- JSON array of float values
+        embedding BLOB NOT NULL,  -- float16 vector bytes
         embedding_model TEXT NOT NULL,
         metadata JSON,  -- Additional metadata as JSON
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -89,13 +315,32 @@ async def init_vector_store():
     
     CREATE INDEX IF NOT EXISTS idx_document_embeddings_chunk_hash
     ON document_embeddings(chunk_hash);
+    
+    CREATE TABLE IF NOT EXISTS document_sketches (
+        document_id INTEGER PRIMARY KEY,
+        simhash INTEGER NOT NULL,  -- 64-bit SimHash of word shingles
+        FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE
+    );
     """
     
+    global vec_enabled
+    
     async with aiosqlite.connect(settings.database_path) as db:
         await db.executescript(create_table_query)
+        await _migrate_json_embeddings(db)
+        await _prune_deleted_documents(db)
+        await _backfill_sketches(db)
+        
+        vec_enabled = await load_vec_extension(db)
+        if vec_enabled:
+            await _init_vec_table(db)
+        
         await db.commit()
     
-    logger.info("Vector store tables initialized")
+    if vec_enabled:
+        logger.info("Vector store tables initialized with sqlite-vec KNN index")
+    else:
+        logger.info("Vector store tables initialized (sqlite-vec unavailable, using full scan search)")
 
 
 def chunk_text(text: str, chunk_size: int = 512, overlap: int = 50) -> List[str]:
@@ -159,9 +404,6 @@ async def generate_document_embeddings(document_id: int, content: str, metadata:
         # Generate document hash
         document_hash = generate_text_hash(content)
         
-        # Get embedding model
-        model = get_embedding_model()
-        
         # Chunk the text
         chunks = chunk_text(content)
         logger.info(f"Document {document_id}: Created {len(chunks)} chunks")
@@ -169,98 +411,193 @@ async def generate_document_embeddings(document_id: int, content: str, metadata:
         if not chunks:
             return {"embeddings_count": 0, "document_hash": document_hash, "full_json": None}
         
-        # Generate embeddings for all chunks
-        embeddings = model.encode(chunks, convert_to_numpy=True, show_progress_bar=False)
-        
-        # Prepare full document JSON
-        full_document_json = {
-            "document_id": document_id,
-            "document_hash": document_hash,
-            "content": content,
-            "content_length": len(content),
-            "chunks_count": len(chunks),
-            "embedding_model": EMBEDDING_MODEL,
-            "embedding_dimensions": embeddings[0].shape[0] if len(embeddings) > 0 else 0,
-            "metadata": metadata or {},
-            "chunks": [],
-            "created_at": datetime.now().isoformat()
-        }
-        
-        # Store embeddings in database
-        async with aiosqlite.connect(settings.database_path) as db:
-            # Delete existing embeddings for this document
+        # Generate embeddings for all chunks in length-sorted batches off the event loop
+        embeddings = await encode_chunks_batched(chunks)
+        
+        return await store_document_embeddings(document_id, content, chunks, embeddings, metadata)
+        
+    except Exception as e:
+        logger.error(f"Failed to generate embeddings for document {document_id}: {e}")
+        raise
+
+
+async def store_document_embeddings(
+    document_id: int,
+    content: str,
+    chunks: List[str],
+    embeddings: np.ndarray,
+    metadata: Optional[Dict] = None
+) -> Dict:
+    """
+    Store pre-computed chunk embeddings and the full document JSON
+    
+    Args:
+        document_id: ID of the document
+        content: Full text content of the document
+        chunks: Text chunks produced by chunk_text()
+        embeddings: One embedding row per chunk
+        metadata: Optional metadata to store with embeddings
+    
+    Returns:
+        Dictionary containing embedding statistics and full document JSON
+    """
+    document_hash = generate_text_hash(content)
+    
+    # Prepare full document JSON
+    full_document_json = {
+        "document_id": document_id,
+        "document_hash": document_hash,
+        "content": content,
+        "content_length": len(content),
+        "chunks_count": len(chunks),
+        "embedding_model": EMBEDDING_MODEL,
+        "embedding_dimensions": embeddings[0].shape[0] if len(embeddings) > 0 else 0,
+        "metadata": metadata or {},
+        "chunks": [],
+        "created_at": datetime.now().isoformat()
+    }
+    
+    # SimHash sketch used to shortlist duplicate candidates; hashing every
+    # shingle is CPU-bound, so it runs off the loop and outside the transaction
+    simhash = await asyncio.to_thread(compute_simhash, content)
+    
+    # Store embeddings in database
+    async with aiosqlite.connect(settings.database_path) as db:
+        use_vec = vec_enabled and await load_vec_extension(db)
+        
+        # Delete existing embeddings for this document
+        if use_vec:
             await db.execute(
-                "DELETE FROM document_embeddings WHERE document_id = ?",
+                f"DELETE FROM {VEC_TABLE} WHERE rowid IN "
+                "(SELECT id FROM document_embeddings WHERE document_id = ?)",
                 (document_id,)
             )
+        await db.execute(
+            "DELETE FROM document_embeddings WHERE document_id = ?",
+            (document_id,)
+        )
+        
+        # Build every chunk row up front so the inserts are one executemany
+        embedding_rows = []
+        for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+            chunk_hash = generate_chunk_hash(document_id, idx, chunk)
+            embedding_list = embedding.tolist()
             
-            # Insert new embeddings with hashes
-            for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                chunk_hash = generate_chunk_hash(document_id, idx, chunk)
-                embedding_list = embedding.tolist()
-                
-                # Add chunk to full document JSON
-                full_document_json["chunks"].append({
-                    "index": idx,
-                    "hash": chunk_hash,
-                    "text": chunk,
-                    "length": len(chunk),
-                    "embedding": embedding_list
-                })
-                
-                # Prepare chunk metadata
-                chunk_metadata = {
-                    "chunk_length": len(chunk),
-                    "position": idx,
-                    "total_chunks": len(chunks)
-                }
-                
-                await db.execute(
-                    """
-                    INSERT INTO document_embeddings 
-                    (document_id, chunk_index, chunk_hash, chunk_text, embedding, embedding_model, metadata)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
+            # Add chunk to full document JSON
+            full_document_json["chunks"].append({
+                "index": idx,
+                "hash": chunk_hash,
+                "text": chunk,
+                "length": len(chunk),
+                "embedding": embedding_list
+            })
+            
+            # Prepare chunk metadata
+            chunk_metadata = {
+                "chunk_length": len(chunk),
+                "position": idx,
+                "total_chunks": len(chunks)
+            }
+            
+            embedding_rows.append((
+                document_id, 
+                idx, 
+                chunk_hash,
+                chunk, 
+                encode_embedding(embedding),
+                EMBEDDING_MODEL,
+                json.dumps(chunk_metadata)
+            ))
+        
+        await db.executemany(
+            """
+            INSERT INTO document_embeddings 
+            (document_id, chunk_index, chunk_hash, chunk_text, embedding, embedding_model, metadata)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            embedding_rows
+        )
+        
+        if use_vec:
+            # Map the new row ids back to chunks; vec0 rowids mirror document_embeddings.id
+            id_rows = await db.execute_fetchall(
+                "SELECT chunk_index, id FROM document_embeddings WHERE document_id = ?",
+                (document_id,)
+            )
+            row_ids = dict(id_rows)
+            await db.executemany(
+                f"INSERT INTO {VEC_TABLE}(rowid, embedding_q, embedding) VALUES (?, vec_int8(?), ?)",
+                [
                     (
-                        document_id, 
-                        idx, 
-                        chunk_hash,
-                        chunk, 
-                        json.dumps(embedding_list), 
-                        EMBEDDING_MODEL,
-                        json.dumps(chunk_metadata)
+                        row_ids[idx],
+                        quantize_int8(embedding),
+                        np.asarray(embedding, dtype=np.float32).tobytes()
                     )
-                )
-            
-            # Update document with full JSON and hash
-            await db.execute(
-                """
-                UPDATE documents 
-                SET full_text_json = ?, file_hash = ?
-                WHERE id = ?
-                """,
-                (json.dumps(full_document_json), document_hash, document_id)
+                    for idx, embedding in enumerate(embeddings[:len(embedding_rows)])
+                ]
             )
-            
-            await db.commit()
         
-        logger.info(f"Stored {len(chunks)} embeddings for document {document_id} with hash {document_hash[:8]}...")
+        await db.execute(
+            "INSERT OR REPLACE INTO document_sketches (document_id, simhash) VALUES (?, ?)",
+            (document_id, simhash)
+        )
         
-        return {
-            "embeddings_count": len(chunks),
-            "document_hash": document_hash,
-            "full_json": full_document_json
-        }
+        # Update document with full JSON. The upload-time file hash is kept so
+        # byte-identical re-uploads still hit the dedup check before processing;
+        # the text hash only fills in documents that never had one
+        await db.execute(
+            """
+            UPDATE documents 
+            SET full_text_json = ?, file_hash = COALESCE(file_hash, ?),
+                updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE id = ?
+            """,
+            (orjson.dumps(full_document_json).decode(), document_hash, document_id)
+        )
         
-    except Exception as e:
-        logger.error(f"Failed to generate embeddings for document {document_id}: {e}")
-        raise
+        await db.commit()
+    
+    logger.info(f"Stored {len(chunks)} embeddings for document {document_id} with hash {document_hash[:8]}...")
+    
+    return {
+        "embeddings_count": len(chunks),
+        "document_hash": document_hash,
+        "full_json": full_document_json
+    }
+
+
+async def delete_document_embeddings(document_id: int) -> None:
+    """
+    Remove a document's chunk embeddings, vec0 vectors and SimHash sketch
+    
+    Args:
+        document_id: ID of the deleted document
+    """
+    async with aiosqlite.connect(settings.database_path) as db:
+        if vec_enabled and await load_vec_extension(db):
+            await db.execute(
+                f"DELETE FROM {VEC_TABLE} WHERE rowid IN "
+                "(SELECT id FROM document_embeddings WHERE document_id = ?)",
+                (document_id,)
+            )
+        await db.execute(
+            "DELETE FROM document_embeddings WHERE document_id = ?",
+            (document_id,)
+        )
+        await db.execute(
+            "DELETE FROM document_sketches WHERE document_id = ?",
+            (document_id,)
+        )
+        await db.commit()
+    
+    logger.info(f"Deleted embeddings for document {document_id}")
 
 
 async def search_similar_documents(
     query: str, 
     limit: int = 10, 
-    threshold: float = 0.5
+    threshold: float = 0.5,
+    document_ids: Optional[List[int]] = None
 ) -> List[Dict]:
     """
     Search for documents similar to the query using vector similarity
@@ -269,6 +606,7 @@ async def search_similar_documents(
         query: Search query text
         limit: Maximum number of results
         threshold: Minimum similarity score (0-1)
+        document_ids: Optional shortlist of documents to search within
     
     Returns:
         List of similar document chunks with metadata
@@ -278,9 +616,17 @@ async def search_similar_documents(
         model = get_embedding_model()
         query_embedding = model.encode(query, convert_to_numpy=True)
         
+        if vec_enabled:
+            return await _search_similar_vec(query_embedding, limit, threshold, document_ids)
+        
+        document_filter = ""
+        if document_ids is not None:
+            placeholders = ','.join(['?' for _ in document_ids])
+            document_filter = f"AND de.document_id IN ({placeholders})"
+        
         # Fetch all embeddings from database
         # Note: For production, consider using a proper vector database
-        fetch_query = """
+        fetch_query = f"""
         SELECT 
             de.id,
             de.document_id,
@@ -291,47 +637,174 @@ async def search_similar_documents(
             d.uploaded_at
         FROM document_embeddings de
         JOIN documents d ON d.id = de.document_id
-        WHERE d.status = 'completed'
+        WHERE d.status = 'completed' {document_filter}
         """
         
-        results = await execute_raw_sql(fetch_query, [])
+        results = await execute_raw_sql(fetch_query, document_ids or [])
         
         if not results:
             return []
         
-        # Calculate similarities
-        similarities = []
+        # Decode stored embeddings, skipping any that cannot be compared
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        rows = []
+        vectors = []
         for row in results:
             try:
-                # Parse stored embedding
-                stored_embedding = np.array(json.loads(row['embedding']))
-                
-                # Calculate cosine similarity
-                similarity = cosine_similarity(query_embedding, stored_embedding)
-                
-                if similarity >= threshold:
-                    similarities.append({
-                        'id': row['id'],
-                        'document_id': row['document_id'],
-                        'chunk_index': row['chunk_index'],
-                        'chunk_text': row['chunk_text'],
-                        'filename': row['filename'],
-                        'uploaded_at': row['uploaded_at'],
-                        'similarity_score': float(similarity)
-                    })
+                stored_embedding = decode_embedding(row['embedding'])
+                if stored_embedding.shape != query_vector.shape:
+                    raise ValueError(f"dimension {stored_embedding.shape[0]} != {query_vector.shape[0]}")
             except Exception as e:
                 logger.warning(f"Failed to process embedding {row['id']}: {e}")
                 continue
+            rows.append(row)
+            vectors.append(stored_embedding)
+        
+        if not rows:
+            return []
         
-        # Sort by similarity and return top results
-        similarities.sort(key=lambda x: x['similarity_score'], reverse=True)
-        return similarities[:limit]
+        # Score every chunk in one matrix-vector product, mapped to the 0-1 range
+        # used by cosine_similarity; zero vectors give NaN and fail the threshold
+        matrix = np.stack(vectors)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = (matrix @ query_vector) / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector))
+        scores = (scores + 1) / 2
+        
+        # Rank passing chunks by descending similarity and keep the top results
+        passing = np.flatnonzero(scores >= threshold)
+        ranked = passing[np.argsort(-scores[passing], kind='stable')][:limit]
+        
+        return [
+            {
+                'id': rows[i]['id'],
+                'document_id': rows[i]['document_id'],
+                'chunk_index': rows[i]['chunk_index'],
+                'chunk_text': rows[i]['chunk_text'],
+                'filename': rows[i]['filename'],
+                'uploaded_at': rows[i]['uploaded_at'],
+                'similarity_score': float(scores[i])
+            }
+            for i in ranked
+        ]
         
     except Exception as e:
         logger.error(f"Vector search failed: {e}")
         raise
 
 
+async def _search_similar_vec(
+    query_embedding: np.ndarray,
+    limit: int,
+    threshold: float,
+    document_ids: Optional[List[int]] = None
+) -> List[Dict]:
+    """
+    KNN search over the sqlite-vec index
+    
+    Fetches limit * VEC_RERANK_FACTOR candidates using the int8 vectors,
+    then orders the live ones (chunks of completed documents) by exact
+    float32 cosine distance. Candidates that fail the liveness filter are
+    made up for by doubling k until limit hits survive, the index is
+    exhausted, or k reaches VEC_KNN_MAX_K; past that the exact distance is
+    computed over all live chunks. With a document shortlist, exact
+    distances are computed for just those documents' chunks.
+    
+    Args:
+        query_embedding: Embedding of the search query
+        limit: Maximum number of results
+        threshold: Minimum similarity score (0-1)
+        document_ids: Optional shortlist of documents to search within
+    
+    Returns:
+        List of similar document chunks with metadata
+    """
+    query_vector = np.asarray(query_embedding, dtype=np.float32).tobytes()
+    
+    document_filter = ""
+    if document_ids is not None:
+        placeholders = ','.join(['?' for _ in document_ids])
+        document_filter = f"AND de.document_id IN ({placeholders})"
+    
+    exact_query = f"""
+    SELECT 
+        de.id,
+        de.document_id,
+        de.chunk_index,
+        de.chunk_text,
+        d.filename,
+        d.uploaded_at,
+        vec_distance_cosine(v.embedding, ?) AS distance
+    FROM document_embeddings de
+    JOIN {VEC_TABLE} v ON v.rowid = de.id
+    JOIN documents d ON d.id = de.document_id
+    WHERE d.status = 'completed' {document_filter}
+    ORDER BY distance
+    LIMIT ?
+    """
+    
+    candidates_query = f"""
+    SELECT rowid
+    FROM {VEC_TABLE}
+    WHERE embedding_q MATCH vec_int8(?) AND k = ?
+    """
+    
+    rerank_query = f"""
+    SELECT 
+        de.id,
+        de.document_id,
+        de.chunk_index,
+        de.chunk_text,
+        d.filename,
+        d.uploaded_at,
+        vec_distance_cosine(v.embedding, ?) AS distance
+    FROM json_each(?) candidates
+    JOIN {VEC_TABLE} v ON v.rowid = candidates.value
+    JOIN document_embeddings de ON de.id = candidates.value
+    JOIN documents d ON d.id = de.document_id
+    WHERE d.status = 'completed'
+    ORDER BY distance
+    LIMIT ?
+    """
+    
+    async with aiosqlite.connect(settings.database_path) as db:
+        await load_vec_extension(db)
+        db.row_factory = aiosqlite.Row
+        
+        if document_ids is not None:
+            rows = await db.execute_fetchall(exact_query, (query_vector, *document_ids, limit))
+        else:
+            query_q = quantize_int8(query_embedding)
+            k = min(limit * VEC_RERANK_FACTOR, VEC_KNN_MAX_K)
+            while True:
+                candidates = await db.execute_fetchall(candidates_query, (query_q, k))
+                candidate_ids = json.dumps([row[0] for row in candidates])
+                rows = await db.execute_fetchall(rerank_query, (query_vector, candidate_ids, limit))
+                if len(rows) >= limit or len(candidates) < k:
+                    break
+                if k == VEC_KNN_MAX_K:
+                    # Too many stale or unfinished chunks ahead of the live ones
+                    rows = await db.execute_fetchall(exact_query, (query_vector, limit))
+                    break
+                k = min(k * 2, VEC_KNN_MAX_K)
+    
+    similarities = []
+    for row in rows:
+        # sqlite-vec cosine distance is 1 - cos; map to the same 0-1 score as cosine_similarity()
+        similarity = 1 - row['distance'] / 2
+        if similarity >= threshold:
+            similarities.append({
+                'id': row['id'],
+                'document_id': row['document_id'],
+                'chunk_index': row['chunk_index'],
+                'chunk_text': row['chunk_text'],
+                'filename': row['filename'],
+                'uploaded_at': row['uploaded_at'],
+                'similarity_score': float(similarity)
+            })
+    
+    return similarities
+
+
 def cosine_similarity(vec1: np.ndarray, vec2: np.ndarray) -> float:
     """
     Calculate cosine similarity between two vectors
@@ -354,6 +827,43 @@ def cosine_similarity(vec1: np.ndarray, vec2: np.ndarray) -> float:
     return (similarity + 1) / 2
 
 
+async def _simhash_candidates(document_id: int, threshold: float) -> Optional[List[int]]:
+    """
+    Shortlist documents whose SimHash is near the target document's
+    
+    Args:
+        document_id: ID of the document to check
+        threshold: Similarity threshold for duplicates (0-1)
+    
+    Returns:
+        Candidate document IDs, or None if the target has no sketch
+    """
+    target = await execute_raw_sql(
+        "SELECT simhash FROM document_sketches WHERE document_id = ?", (document_id,)
+    )
+    if not target:
+        return None
+    target_hash = target[0]['simhash']
+    
+    # One sketch row per document; embedded documents always have one
+    # (written with the embeddings, backfilled by init_vector_store)
+    sketch_query = """
+    SELECT s.document_id, s.simhash
+    FROM document_sketches s
+    JOIN documents d ON d.id = s.document_id
+    WHERE d.status = 'completed' AND s.document_id != ?
+    """
+    sketches = await execute_raw_sql(sketch_query, (document_id,))
+    
+    # threshold 0.9 allows 12 differing bits; below ~0.75 nothing is filtered out
+    max_distance = min(SIMHASH_BITS, int((1 - threshold) * 2 * SIMHASH_BITS))
+    return [
+        row['document_id']
+        for row in sketches
+        if simhash_distance(row['simhash'], target_hash) <= max_distance
+    ]
+
+
 async def find_duplicate_documents(
     document_id: int, 
     threshold: float = 0.9
@@ -361,6 +871,11 @@ async def find_duplicate_documents(
     """
     Find potential duplicate documents based on embedding similarity
     
+    Candidates are first shortlisted by SimHash Hamming distance, with a
+    radius that widens as the threshold drops. Only the shortlist goes
+    through vector similarity; without a sketch for the target document
+    every document is searched.
+    
     Args:
         document_id: ID of the document to check
         threshold: Similarity threshold for duplicates (0-1)
@@ -369,12 +884,13 @@ async def find_duplicate_documents(
         List of potential duplicate documents
     """
     try:
-        # Get embeddings for the target document
+        # Get the leading chunks of the target document
         target_query = """
-        SELECT chunk_text, embedding
+        SELECT chunk_text
         FROM document_embeddings
         WHERE document_id = ?
         ORDER BY chunk_index
+        LIMIT 3
         """
         
         target_embeddings = await execute_raw_sql(target_query, (document_id,))
@@ -382,14 +898,19 @@ async def find_duplicate_documents(
         if not target_embeddings:
             return []
         
+        candidate_ids = await _simhash_candidates(document_id, threshold)
+        if candidate_ids is not None and not candidate_ids:
+            return []
+        
         # Combine chunk texts for similarity search
-        combined_text = " ".join([chunk['chunk_text'] for chunk in target_embeddings[:3]])
+        combined_text = " ".join([chunk['chunk_text'] for chunk in target_embeddings])
         
         # Search for similar documents
         similar_docs = await search_similar_documents(
             combined_text, 
             limit=20, 
-            threshold=threshold
+            threshold=threshold,
+            document_ids=candidate_ids
         )
         
         # Group by document and filter out the source document
@@ -422,20 +943,75 @@ async def find_duplicate_documents(
         raise
 
 
-async def update_all_embeddings():
+async def encode_chunks_batched(chunks: List[str]) -> np.ndarray:
+    """
+    Encode chunks in length-sorted micro-batches run concurrently
+    
+    Sorting by length keeps similar-length texts together so each batch
+    pads to a short maximum. Batches are encoded in worker threads, at
+    most EMBEDDING_CONCURRENCY at a time.
+    
+    Args:
+        chunks: Text chunks to encode
+    
+    Returns:
+        Embedding matrix with one row per chunk, in input order
+    """
+    model = get_embedding_model()
+    order = sorted(range(len(chunks)), key=lambda i: len(chunks[i]))
+    batches = [
+        order[i:i + EMBEDDING_ENCODE_BATCH_SIZE]
+        for i in range(0, len(order), EMBEDDING_ENCODE_BATCH_SIZE)
+    ]
+    semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+    
+    async def encode_batch(indices: List[int]) -> np.ndarray:
+        async with semaphore:
+            return await asyncio.to_thread(
+                model.encode,
+                [chunks[i] for i in indices],
+                batch_size=len(indices),
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+    
+    results = await asyncio.gather(*(encode_batch(batch) for batch in batches))
+    
+    # Scatter batch results back into input order
+    embeddings = np.empty((len(chunks), results[0].shape[1]), dtype=results[0].dtype)
+    for indices, batch_embeddings in zip(batches, results):
+        embeddings[indices] = batch_embeddings
+    return embeddings
+
+
+async def update_all_embeddings(batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE):
     """
     Update embeddings for all documents that don't have them yet
+    
+    Chunks from up to batch_size documents are encoded together in
+    length-sorted micro-batches (see encode_chunks_batched).
+    
+    Args:
+        batch_size: Number of documents to embed per model call
+    
+    Returns:
+        Total number of chunk embeddings created
     """
     try:
+        # Sketch documents embedded before SimHash prefiltering existed
+        async with aiosqlite.connect(settings.database_path) as db:
+            await _backfill_sketches(db)
+            await db.commit()
+        
         # Find documents without embeddings
         query = """
         SELECT d.id, d.content
         FROM documents d
-        LEFT JOIN document_embeddings de ON d.id = de.document_id
         WHERE d.status = 'completed' 
           AND d.content IS NOT NULL
-          AND de.id IS NULL
-        GROUP BY d.id
+          AND NOT EXISTS (
+              SELECT 1 FROM document_embeddings de WHERE de.document_id = d.id
+          )
         """
         
         documents = await execute_raw_sql(query, [])
@@ -447,20 +1023,46 @@ async def update_all_embeddings():
         logger.info(f"Updating embeddings for {len(documents)} documents")
         
         total_embeddings = 0
-        for doc in documents:
+        
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            
+            # Chunk every document in the batch and remember each one's slice
+            doc_chunks = [(doc, chunk_text(doc['content'])) for doc in batch]
+            all_chunks = [chunk for _, chunks in doc_chunks for chunk in chunks]
+            
+            if not all_chunks:
+                continue
+            
             try:
-                count = await generate_document_embeddings(
-                    doc['id'], 
-                    doc['content']
-                )
-                total_embeddings += count
+                embeddings = await encode_chunks_batched(all_chunks)
             except Exception as e:
-                logger.error(f"Failed to update embeddings for document {doc['id']}: {e}")
+                logger.error(f"Failed to encode embedding batch starting at document {batch[0]['id']}: {e}")
                 continue
+            
+            offset = 0
+            for doc, chunks in doc_chunks:
+                doc_embeddings = embeddings[offset:offset + len(chunks)]
+                offset += len(chunks)
+                
+                if not chunks:
+                    continue
+                
+                try:
+                    result = await store_document_embeddings(
+                        doc['id'],
+                        doc['content'],
+                        chunks,
+                        doc_embeddings
+                    )
+                    total_embeddings += result['embeddings_count']
+                except Exception as e:
+                    logger.error(f"Failed to update embeddings for document {doc['id']}: {e}")
+                    continue
         
         logger.info(f"Created {total_embeddings} total embeddings")
         return total_embeddings
         
     except Exception as e:
         logger.error(f"Batch embedding update failed: {e}")
-        raise
\ No newline at end of file
+        raise
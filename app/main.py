@@ -17,7 +17,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 
 from app.core.config import get_settings
-from app.core.database import init_database
+from app.core.database import init_database, close_raw_connection
 from app.api.routes import documents, health, search
 from app.core.logging_config import setup_logging
 
@@ -50,6 +50,7 @@ async def lifespan(app: FastAPI):
     yield
     
     logger.info("🛑 Shutting down Kansofy-Trade")
+    await close_raw_connection()
 
 
 # Initialize FastAPI app
@@ -6,13 +6,21 @@ Model Context Protocol server providing Claude with document intelligence tools.
 Enables semantic search, document analysis, and content extraction.
 """
 
-import json
+import time
+import shutil
 import logging
 import asyncio
 import aiosqlite
-from datetime import datetime
+import orjson
+from collections import OrderedDict
+from operator import itemgetter
 from typing import Any, Dict, List, Optional
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import (
@@ -24,10 +32,10 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.core.database import get_db_context, execute_raw_sql, search_documents_fts5
+from app.core.database import get_db_context, execute_raw_sql, search_documents_fts5, close_raw_connection
 from app.core.config import get_settings
 from app.models.document import DocumentStatus
-from app.services.document_processor import DocumentProcessor
+from app.services.document_processor import DocumentProcessor, generate_file_hash
 from app.core.vector_store import (
     init_vector_store, 
     search_similar_documents,
@@ -43,6 +51,29 @@ settings = get_settings()
 document_processor = DocumentProcessor()
 DATABASE_PATH = os.getenv("DATABASE_PATH", "./kansofy_trade.db")
 
+# full_text_json summaries, LRU-cached by (document_id, updated_at) so edits invalidate entries
+FULL_JSON_CACHE_SIZE = 128
+_full_json_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+
+# Fields shown by get_document_json, as JSON paths into full_text_json
+_FULL_JSON_SUMMARY_PATHS = {
+    "document_hash": "$.document_hash",
+    "content_length": "$.content_length",
+    "chunks_count": "$.chunks_count",
+    "embedding_model": "$.embedding_model",
+    "embedding_dimensions": "$.embedding_dimensions",
+    "metadata": "$.metadata",
+    "first_chunk_index": "$.chunks[0].index",
+    "first_chunk_hash": "$.chunks[0].hash",
+    "first_chunk_length": "$.chunks[0].length",
+    "first_chunk_text": "$.chunks[0].text",
+    "first_chunk_embedding": "$.chunks[0].embedding[0]",
+}
+
+# Upload directory size is cached as (expiry, size_bytes) to avoid rescanning on every health check
+UPLOAD_SIZE_CACHE_TTL = 300  # seconds
+_upload_size_cache = (0.0, 0)
+
 # Initialize MCP Server
 server = Server("kansofy-trade")
 
@@ -208,7 +239,15 @@ TOOLS = [
         description="Update vector embeddings for all documents that don't have them yet. Run this after uploading new documents to enable vector search.",
         inputSchema={
             "type": "object",
-            "properties": {}
+            "properties": {
+                "batch_size": {
+                    "type": "integer",
+                    "description": "Number of documents to embed per model call",
+                    "default": 32,
+                    "minimum": 1,
+                    "maximum": 256
+                }
+            }
         }
     ),
     
@@ -319,34 +358,10 @@ async def handle_call_tool(name: str, arguments: dict[str, Any]) -> list[TextCon
     logger.info(f"🔧 Tool called: {name} with arguments: {arguments}")
     
     try:
-        if name == "search_documents":
-            return await search_documents_tool(arguments)
-        elif name == "get_document_details":
-            return await get_document_details_tool(arguments)
-        elif name == "get_document_statistics":
-            return await get_document_statistics_tool(arguments)
-        elif name == "analyze_document_content":
-            return await analyze_document_content_tool(arguments)
-        elif name == "get_system_health":
-            return await get_system_health_tool(arguments)
-        elif name == "vector_search":
-            return await vector_search_tool(arguments)
-        elif name == "find_duplicates":
-            return await find_duplicates_tool(arguments)
-        elif name == "update_embeddings":
-            return await update_embeddings_tool(arguments)
-        elif name == "get_document_json":
-            return await get_document_json_tool(arguments)
-        elif name == "check_duplicate_by_hash":
-            return await check_duplicate_by_hash_tool(arguments)
-        elif name == "get_document_tables":
-            return await get_document_tables_tool(arguments)
-        elif name == "upload_document":
-            return await upload_document_tool(arguments)
-        elif name == "process_pending_documents":
-            return await process_pending_documents_tool(arguments)
-        else:
+        handler = TOOL_HANDLERS.get(name)
+        if handler is None:
             return [TextContent(type="text", text=f"Unknown tool: {name}")]
+        return await handler(arguments)
             
     except Exception as e:
         logger.error(f"Tool execution failed: {e}")
@@ -365,8 +380,8 @@ async def search_documents_tool(arguments: dict) -> list[TextContent]:
         return [TextContent(type="text", text="Search query cannot be empty")]
     
     try:
-        # Execute FTS5 search
-        results = await search_documents_fts5(query, limit)
+        # Execute FTS5 search, letting FTS5 emit markdown bold around matches
+        results = await search_documents_fts5(query, limit, highlight_start="**", highlight_end="**")
         
         if not results:
             return [TextContent(
@@ -375,27 +390,43 @@ async def search_documents_tool(arguments: dict) -> list[TextContent]:
             )]
         
         # Format results
-        response = f"📄 Found {len(results)} documents matching '{query}':\\n\\n"
+        parts: list[str] = [f"📄 Found {len(results)} documents matching '{query}':\\n\\n"]
         
         for i, doc in enumerate(results, 1):
-            response += f"**{i}. {doc['filename']}**\\n"
-            response += f"   ID: {doc['id']} | Size: {doc['file_size']:,} bytes\\n"
-            response += f"   Uploaded: {doc['uploaded_at']}\\n"
+            parts.append(f"**{i}. {doc['filename']}**\\n")
+            parts.append(f"   ID: {doc['id']} | Size: {doc['file_size']:,} bytes\\n")
+            parts.append(f"   Uploaded: {doc['uploaded_at']}\\n")
             
             if doc.get('snippet'):
-                # Clean up snippet
-                snippet = doc['snippet'].replace('<mark>', '**').replace('</mark>', '**')
-                response += f"   Preview: {snippet}\\n"
+                parts.append(f"   Preview: {doc['snippet']}\\n")
             
-            response += f"   Relevance: {doc.get('relevance_score', 0.0):.3f}\\n\\n"
+            parts.append(f"   Relevance: {doc.get('relevance_score', 0.0):.3f}\\n\\n")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Search failed: {e}")
         return [TextContent(type="text", text=f"Search operation failed: {str(e)}")]
 
 
+# Document details queries - the metadata-only variant skips reading the large content column
+_DOC_META_SQL = """
+    SELECT id, filename, original_filename, file_size, content_type, status,
+           doc_metadata, entities, summary, confidence_score,
+           uploaded_at, processed_at, updated_at
+    FROM documents 
+    WHERE id = ?
+"""
+
+_DOC_FULL_SQL = """
+    SELECT id, filename, original_filename, file_size, content_type, status,
+           content, doc_metadata, entities, summary, confidence_score,
+           uploaded_at, processed_at, updated_at
+    FROM documents 
+    WHERE id = ?
+"""
+
+
 async def get_document_details_tool(arguments: dict) -> list[TextContent]:
     """Get detailed document information"""
     document_id = arguments.get("document_id")
@@ -406,14 +437,7 @@ async def get_document_details_tool(arguments: dict) -> list[TextContent]:
     
     try:
         # Query document details
-        query = """
-            SELECT id, filename, original_filename, file_size, content_type, status,
-                   content, doc_metadata, entities, summary, confidence_score,
-                   uploaded_at, processed_at, updated_at
-            FROM documents 
-            WHERE id = ?
-        """
-        
+        query = _DOC_FULL_SQL if include_content else _DOC_META_SQL
         results = await execute_raw_sql(query, [document_id])
         
         if not results:
@@ -425,40 +449,40 @@ async def get_document_details_tool(arguments: dict) -> list[TextContent]:
         doc = results[0]
         
         # Format response
-        response = f"📄 **Document Details**\\n\\n"
-        response += f"**ID:** {doc['id']}\\n"
-        response += f"**Filename:** {doc['filename']}\\n"
-        response += f"**Original Name:** {doc['original_filename']}\\n"
-        response += f"**Size:** {doc['file_size']:,} bytes\\n"
-        response += f"**Type:** {doc['content_type'] or 'Unknown'}\\n"
-        response += f"**Status:** {doc['status']}\\n"
-        response += f"**Confidence:** {doc['confidence_score']:.3f}\\n"
-        response += f"**Uploaded:** {doc['uploaded_at']}\\n"
+        parts: list[str] = [f"📄 **Document Details**\\n\\n"]
+        parts.append(f"**ID:** {doc['id']}\\n")
+        parts.append(f"**Filename:** {doc['filename']}\\n")
+        parts.append(f"**Original Name:** {doc['original_filename']}\\n")
+        parts.append(f"**Size:** {doc['file_size']:,} bytes\\n")
+        parts.append(f"**Type:** {doc['content_type'] or 'Unknown'}\\n")
+        parts.append(f"**Status:** {doc['status']}\\n")
+        parts.append(f"**Confidence:** {doc['confidence_score']:.3f}\\n")
+        parts.append(f"**Uploaded:** {doc['uploaded_at']}\\n")
         
         if doc['processed_at']:
-            response += f"**Processed:** {doc['processed_at']}\\n"
+            parts.append(f"**Processed:** {doc['processed_at']}\\n")
         
         # Add entities if available
         if doc['entities']:
             try:
-                entities = json.loads(doc['entities']) if isinstance(doc['entities'], str) else doc['entities']
-                response += "\\n**📋 Extracted Entities:**\\n"
+                entities = orjson.loads(doc['entities']) if isinstance(doc['entities'], str) else doc['entities']
+                parts.append("\\n**📋 Extracted Entities:**\\n")
                 
                 for category, items in entities.items():
                     if items:
-                        response += f"- **{category.title()}:** {', '.join(items)}\\n"
+                        parts.append(f"- **{category.title()}:** {', '.join(items)}\\n")
             except Exception as e:
                 logger.warning(f"Failed to parse entities: {e}")
         
         # Add summary if available
         if doc['summary']:
-            response += f"\\n**📝 Summary:**\\n{doc['summary']}\\n"
+            parts.append(f"\\n**📝 Summary:**\\n{doc['summary']}\\n")
         
         # Add metadata if available
         if doc['doc_metadata']:
             try:
-                metadata = json.loads(doc['doc_metadata']) if isinstance(doc['doc_metadata'], str) else doc['doc_metadata']
-                response += f"\\n**🏷️ Metadata:**\\n{json.dumps(metadata, indent=2)}\\n"
+                metadata = orjson.loads(doc['doc_metadata']) if isinstance(doc['doc_metadata'], str) else doc['doc_metadata']
+                parts.append(f"\\n**🏷️ Metadata:**\\n{orjson.dumps(metadata, option=orjson.OPT_INDENT_2).decode()}\\n")
             except Exception as e:
                 logger.warning(f"Failed to parse metadata: {e}")
         
@@ -467,9 +491,9 @@ async def get_document_details_tool(arguments: dict) -> list[TextContent]:
             content_preview = doc['content'][:1000]
             if len(doc['content']) > 1000:
                 content_preview += "... (truncated)"
-            response += f"\\n**📄 Content Preview:**\\n```\\n{content_preview}\\n```\\n"
+            parts.append(f"\\n**📄 Content Preview:**\\n```\\n{content_preview}\\n```\\n")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Failed to get document details: {e}")
@@ -498,16 +522,16 @@ async def get_document_statistics_tool(arguments: dict) -> list[TextContent]:
         stats = stats_results[0] if stats_results else {}
         
         # Format response
-        response = "📊 **Document Collection Statistics**\\n\\n"
-        response += f"**Total Documents:** {stats.get('total_documents', 0):,}\\n"
-        response += f"**Total Size:** {stats.get('total_size', 0) / 1024 / 1024:.1f} MB\\n"
-        response += f"**Average Confidence:** {stats.get('avg_confidence', 0):.3f}\\n"
-        response += f"**Recent Uploads (24h):** {stats.get('recent_uploads', 0)}\\n\\n"
+        parts: list[str] = ["📊 **Document Collection Statistics**\\n\\n"]
+        parts.append(f"**Total Documents:** {stats.get('total_documents', 0):,}\\n")
+        parts.append(f"**Total Size:** {stats.get('total_size', 0) / 1024 / 1024:.1f} MB\\n")
+        parts.append(f"**Average Confidence:** {stats.get('avg_confidence', 0):.3f}\\n")
+        parts.append(f"**Recent Uploads (24h):** {stats.get('recent_uploads', 0)}\\n\\n")
         
-        response += f"**📈 Processing Status:**\\n"
-        response += f"- ✅ Completed: {stats.get('completed_docs', 0)}\\n"
-        response += f"- 🔄 Processing: {stats.get('processing_docs', 0)}\\n"
-        response += f"- ❌ Failed: {stats.get('failed_docs', 0)}\\n\\n"
+        parts.append(f"**📈 Processing Status:**\\n")
+        parts.append(f"- ✅ Completed: {stats.get('completed_docs', 0)}\\n")
+        parts.append(f"- 🔄 Processing: {stats.get('processing_docs', 0)}\\n")
+        parts.append(f"- ❌ Failed: {stats.get('failed_docs', 0)}\\n\\n")
         
         if detailed:
             # Content type breakdown
@@ -522,11 +546,11 @@ async def get_document_statistics_tool(arguments: dict) -> list[TextContent]:
             content_types = await execute_raw_sql(content_type_query)
             
             if content_types:
-                response += "**📄 By Content Type:**\\n"
+                parts.append("**📄 By Content Type:**\\n")
                 for ct in content_types:
                     size_mb = ct['total_size'] / 1024 / 1024
-                    response += f"- {ct['content_type']}: {ct['count']} files ({size_mb:.1f} MB)\\n"
-                response += "\\n"
+                    parts.append(f"- {ct['content_type']}: {ct['count']} files ({size_mb:.1f} MB)\\n")
+                parts.append("\\n")
             
             # Recent activity
             recent_query = """
@@ -540,11 +564,11 @@ async def get_document_statistics_tool(arguments: dict) -> list[TextContent]:
             recent_activity = await execute_raw_sql(recent_query)
             
             if recent_activity:
-                response += "**📅 Recent Activity (Last 7 Days):**\\n"
+                parts.append("**📅 Recent Activity (Last 7 Days):**\\n")
                 for day in recent_activity:
-                    response += f"- {day['upload_date']}: {day['count']} uploads\\n"
+                    parts.append(f"- {day['upload_date']}: {day['count']} uploads\\n")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Failed to get statistics: {e}")
@@ -565,27 +589,21 @@ async def analyze_document_content_tool(arguments: dict) -> list[TextContent]:
         
         if document_id:
             # Analyze specific document
-            doc_query = """
-                SELECT id, filename, content, entities, summary, confidence_score
-                FROM documents 
-                WHERE id = ? AND status = 'completed'
-            """
-            doc_results = await execute_raw_sql(doc_query, [document_id])
-            documents = doc_results
-            
-        elif search_query:
+            doc_ids = [document_id]
+        else:
             # Find documents matching search query
             search_results = await search_documents_fts5(search_query, 5)
-            doc_ids = [str(doc['id']) for doc in search_results]
-            
-            if doc_ids:
-                placeholders = ','.join(['?' for _ in doc_ids])
-                doc_query = f"""
-                    SELECT id, filename, content, entities, summary, confidence_score
-                    FROM documents 
-                    WHERE id IN ({placeholders}) AND status = 'completed'
-                """
-                documents = await execute_raw_sql(doc_query, doc_ids)
+            doc_ids = [doc['id'] for doc in search_results]
+        
+        if doc_ids:
+            placeholders = ','.join(['?' for _ in doc_ids])
+            # Only the content length is needed, so let SQLite compute it
+            doc_query = f"""
+                SELECT id, filename, length(content) AS content_length, confidence_score
+                FROM documents 
+                WHERE id IN ({placeholders}) AND status = 'completed'
+            """
+            documents = await execute_raw_sql(doc_query, doc_ids)
         
         if not documents:
             return [TextContent(
@@ -594,45 +612,51 @@ async def analyze_document_content_tool(arguments: dict) -> list[TextContent]:
             )]
         
         # Perform analysis
-        response = "🔍 **Document Content Analysis**\\n\\n"
-        response += f"**Analyzed {len(documents)} document(s)**\\n\\n"
+        parts: list[str] = ["🔍 **Document Content Analysis**\\n\\n"]
+        parts.append(f"**Analyzed {len(documents)} document(s)**\\n\\n")
+        
+        # Union entities per category with JSON1, skipping malformed entity JSON.
+        # Categories keep first-seen order (by document id, then key position);
+        # position packs both into one integer so MIN() finds the first sighting
+        entities_query = f"""
+            SELECT category, json_group_array(value) FILTER (WHERE item_id IS NOT NULL) AS items
+            FROM (
+                SELECT category.key AS category, item.value AS value, item.id AS item_id,
+                       (d.id << 32) + category.id AS position
+                FROM documents d,
+                     json_each(CASE WHEN json_valid(d.entities) THEN
+                         CASE WHEN json_type(d.entities) = 'object' THEN d.entities END
+                     END) AS category
+                     LEFT JOIN json_each(CASE WHEN category.type = 'array' THEN category.value END) AS item
+                WHERE d.id IN ({placeholders}) AND d.status = 'completed'
+                ORDER BY d.id, category.id, item.id
+            )
+            GROUP BY category
+            ORDER BY MIN(position)
+        """
+        entity_rows = await execute_raw_sql(entities_query, doc_ids)
+        all_entities = {row['category']: orjson.loads(row['items']) for row in entity_rows}
         
         # Aggregate analysis
-        all_entities = {}
-        total_content_length = 0
-        avg_confidence = 0
-        
-        for doc in documents:
-            total_content_length += len(doc['content']) if doc['content'] else 0
-            avg_confidence += doc['confidence_score'] or 0
-            
-            # Parse entities
-            if doc['entities']:
-                try:
-                    entities = json.loads(doc['entities']) if isinstance(doc['entities'], str) else doc['entities']
-                    for category, items in entities.items():
-                        if category not in all_entities:
-                            all_entities[category] = []
-                        all_entities[category].extend(items)
-                except Exception as e:
-                    logger.warning(f"Failed to parse entities for doc {doc['id']}: {e}")
+        total_content_length = sum(doc['content_length'] or 0 for doc in documents)
+        avg_confidence = sum(doc['confidence_score'] or 0 for doc in documents)
         
         avg_confidence /= len(documents)
         
         # Format results based on analysis type
         if analysis_type in ["entities", "all"]:
-            response += "**🏷️ Extracted Entities:**\\n"
+            parts.append("**🏷️ Extracted Entities:**\\n")
             for category, items in all_entities.items():
                 if items:
                     unique_items = list(set(items))[:10]  # Top 10 unique items
-                    response += f"- **{category.title()}:** {', '.join(unique_items)}\\n"
-            response += "\\n"
+                    parts.append(f"- **{category.title()}:** {', '.join(unique_items)}\\n")
+            parts.append("\\n")
         
         if analysis_type in ["summary", "all"]:
-            response += "**📝 Key Insights:**\\n"
-            response += f"- Average processing confidence: {avg_confidence:.3f}\\n"
-            response += f"- Total content analyzed: {total_content_length:,} characters\\n"
-            response += f"- Average content per document: {total_content_length // len(documents):,} characters\\n"
+            parts.append("**📝 Key Insights:**\\n")
+            parts.append(f"- Average processing confidence: {avg_confidence:.3f}\\n")
+            parts.append(f"- Total content analyzed: {total_content_length:,} characters\\n")
+            parts.append(f"- Average content per document: {total_content_length // len(documents):,} characters\\n")
             
             # Most common entities
             entity_counts = {}
@@ -641,12 +665,12 @@ async def analyze_document_content_tool(arguments: dict) -> list[TextContent]:
             
             if entity_counts:
                 max_category = max(entity_counts.items(), key=lambda x: x[1])
-                response += f"- Most diverse entity type: {max_category[0]} ({max_category[1]} unique items)\\n"
+                parts.append(f"- Most diverse entity type: {max_category[0]} ({max_category[1]} unique items)\\n")
             
-            response += "\\n"
+            parts.append("\\n")
         
         if analysis_type in ["patterns", "all"]:
-            response += "**📊 Content Patterns:**\\n"
+            parts.append("**📊 Content Patterns:**\\n")
             
             # Analyze filenames for patterns
             extensions = {}
@@ -657,16 +681,16 @@ async def analyze_document_content_tool(arguments: dict) -> list[TextContent]:
                     extensions[ext] = extensions.get(ext, 0) + 1
             
             if extensions:
-                response += "- File types: "
-                response += ", ".join([f"{ext} ({count})" for ext, count in extensions.items()])
-                response += "\\n"
+                parts.append("- File types: ")
+                parts.append(", ".join([f"{ext} ({count})" for ext, count in extensions.items()]))
+                parts.append("\\n")
             
             # Content length distribution
-            lengths = [len(doc['content']) if doc['content'] else 0 for doc in documents]
+            lengths = [doc['content_length'] or 0 for doc in documents]
             if lengths:
-                response += f"- Content length range: {min(lengths):,} - {max(lengths):,} characters\\n"
+                parts.append(f"- Content length range: {min(lengths):,} - {max(lengths):,} characters\\n")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Content analysis failed: {e}")
@@ -678,75 +702,101 @@ async def get_system_health_tool(arguments: dict) -> list[TextContent]:
     include_metrics = arguments.get("include_metrics", False)
     
     try:
-        response = "🏥 **System Health Check**\\n\\n"
-        
-        # Database connectivity
-        try:
-            db_test = await execute_raw_sql("SELECT 1 as test")
-            db_healthy = len(db_test) > 0
-        except Exception:
-            db_healthy = False
-        
-        response += f"**Database:** {'✅ Connected' if db_healthy else '❌ Disconnected'}\\n"
-        
-        # FTS5 search capability
-        try:
-            fts_test = await execute_raw_sql("SELECT count(*) FROM document_search")
-            fts_healthy = True
-        except Exception:
-            fts_healthy = False
-        
-        response += f"**Search Index:** {'✅ Available' if fts_healthy else '❌ Unavailable'}\\n"
-        
-        # Upload directory
-        upload_dir_healthy = settings.upload_path.exists() and settings.upload_path.is_dir()
-        response += f"**Upload Directory:** {'✅ Ready' if upload_dir_healthy else '❌ Not Ready'}\\n"
-        
+        parts: list[str] = ["🏥 **System Health Check**\\n\\n"]
+
         # Processing status
         processing_query = """
-            SELECT 
+            SELECT
                 COUNT(CASE WHEN status = 'processing' THEN 1 END) as processing_count,
                 COUNT(CASE WHEN status = 'failed' THEN 1 END) as failed_count
             FROM documents
         """
-        
-        processing_stats = await execute_raw_sql(processing_query)
+
+        # Database, FTS5 and processing probes are independent - run them concurrently
+        db_test, fts_test, processing_stats = await asyncio.gather(
+            execute_raw_sql("SELECT 1 as test"),
+            execute_raw_sql("SELECT 1 FROM document_search LIMIT 1"),
+            execute_raw_sql(processing_query),
+            return_exceptions=True
+        )
+
+        # Database connectivity
+        db_healthy = not isinstance(db_test, Exception) and len(db_test) > 0
+        parts.append(f"**Database:** {'✅ Connected' if db_healthy else '❌ Disconnected'}\\n")
+
+        # FTS5 search capability
+        fts_healthy = not isinstance(fts_test, Exception)
+        parts.append(f"**Search Index:** {'✅ Available' if fts_healthy else '❌ Unavailable'}\\n")
+
+        # Upload directory
+        upload_dir_healthy = settings.upload_path.exists() and settings.upload_path.is_dir()
+        parts.append(f"**Upload Directory:** {'✅ Ready' if upload_dir_healthy else '❌ Not Ready'}\\n")
+
+        if isinstance(processing_stats, Exception):
+            raise processing_stats
         if processing_stats:
             stats = processing_stats[0]
             processing_count = stats.get('processing_count', 0)
             failed_count = stats.get('failed_count', 0)
             
-            response += f"**Processing Queue:** {processing_count} active, {failed_count} failed\\n"
+            parts.append(f"**Processing Queue:** {processing_count} active, {failed_count} failed\\n")
         
         # Overall health
         overall_healthy = all([db_healthy, fts_healthy, upload_dir_healthy])
-        response += f"\\n**Overall Status:** {'✅ Healthy' if overall_healthy else '⚠️ Issues Detected'}\\n"
+        parts.append(f"\\n**Overall Status:** {'✅ Healthy' if overall_healthy else '⚠️ Issues Detected'}\\n")
         
         if include_metrics:
-            response += "\\n**📊 Performance Metrics:**\\n"
+            parts.append("\\n**📊 Performance Metrics:**\\n")
             
             # Database performance
-            perf_start = datetime.now()
+            perf_start = time.perf_counter()
             await execute_raw_sql("SELECT COUNT(*) FROM documents")
-            perf_time = (datetime.now() - perf_start).total_seconds()
-            response += f"- Database query latency: {perf_time:.3f}s\\n"
+            perf_time = time.perf_counter() - perf_start
+            parts.append(f"- Database query latency: {perf_time:.3f}s\\n")
             
             # Disk usage
             if settings.upload_path.exists():
-                total_size = sum(f.stat().st_size for f in settings.upload_path.glob('**/*') if f.is_file())
-                response += f"- Upload directory size: {total_size / 1024 / 1024:.1f} MB\\n"
+                total_size = await get_upload_dir_size()
+                parts.append(f"- Upload directory size: {total_size / 1024 / 1024:.1f} MB\\n")
             
             # Configuration
-            response += f"- Max file size: {settings.max_file_size / 1024 / 1024:.1f} MB\\n"
-            response += f"- Allowed extensions: {', '.join(settings.allowed_extensions)}\\n"
+            parts.append(f"- Max file size: {settings.max_file_size / 1024 / 1024:.1f} MB\\n")
+            parts.append(f"- Allowed extensions: {', '.join(settings.allowed_extensions)}\\n")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         return [TextContent(type="text", text=f"Health check failed: {str(e)}")]
 
 
+def _directory_size(path: str) -> int:
+    """Recursively sum file sizes under a directory using os.scandir"""
+    total = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                total += _directory_size(entry.path)
+            elif entry.is_file():
+                total += entry.stat().st_size
+    return total
+
+
+async def get_upload_dir_size() -> int:
+    """Get upload directory size in bytes, rescanning at most once per UPLOAD_SIZE_CACHE_TTL"""
+    global _upload_size_cache
+    expires_at, size = _upload_size_cache
+    now = time.monotonic()
+    if now >= expires_at:
+        size = await asyncio.to_thread(_directory_size, str(settings.upload_path))
+        _upload_size_cache = (now + UPLOAD_SIZE_CACHE_TTL, size)
+    return size
+
+
+# Fields unpacked from each vector search hit when rendering results
+_VECTOR_RESULT_FIELDS = itemgetter('document_id', 'filename', 'chunk_index', 'similarity_score', 'chunk_text')
+
+
 async def vector_search_tool(arguments: dict) -> list[TextContent]:
     """Search documents using vector similarity"""
     query = arguments.get("query", "")
@@ -767,31 +817,27 @@ async def vector_search_tool(arguments: dict) -> list[TextContent]:
             )]
         
         # Format results
-        response = f"🔮 **Vector Search Results**\n"
-        response += f"Query: '{query}'\n"
-        response += f"Found {len(results)} similar document chunks:\n\n"
+        parts: list[str] = [f"🔮 **Vector Search Results**\n"]
+        parts.append(f"Query: '{query}'\n")
+        parts.append(f"Found {len(results)} similar document chunks:\n\n")
         
         # Group results by document
         docs_seen = set()
-        for i, result in enumerate(results, 1):
-            doc_id = result['document_id']
-            
+        for doc_id, filename, chunk_index, similarity, chunk_text in map(_VECTOR_RESULT_FIELDS, results):
             # Show document header only once
             if doc_id not in docs_seen:
-                response += f"**📄 {result['filename']}** (ID: {doc_id})\n"
+                parts.append(f"**📄 {filename}** (ID: {doc_id})\n")
                 docs_seen.add(doc_id)
             
             # Show chunk details
-            response += f"  • Chunk {result['chunk_index'] + 1}: "
-            response += f"**{result['similarity_score']:.1%}** similarity\n"
+            parts.append(f"  • Chunk {chunk_index + 1}: ")
+            parts.append(f"**{similarity:.1%}** similarity\n")
             
             # Show preview of chunk text
-            preview = result['chunk_text'][:200]
-            if len(result['chunk_text']) > 200:
-                preview += "..."
-            response += f"    {preview}\n\n"
+            preview = chunk_text if len(chunk_text) <= 200 else chunk_text[:200] + "..."
+            parts.append(f"    {preview}\n\n")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Vector search failed: {e}")
@@ -817,17 +863,17 @@ async def find_duplicates_tool(arguments: dict) -> list[TextContent]:
             )]
         
         # Format results
-        response = f"🔍 **Duplicate Detection Results**\n"
-        response += f"Checking document ID: {document_id}\n"
-        response += f"Similarity threshold: {threshold:.1%}\n\n"
-        response += f"**Found {len(duplicates)} potential duplicate(s):**\n\n"
+        parts: list[str] = [f"🔍 **Duplicate Detection Results**\n"]
+        parts.append(f"Checking document ID: {document_id}\n")
+        parts.append(f"Similarity threshold: {threshold:.1%}\n\n")
+        parts.append(f"**Found {len(duplicates)} potential duplicate(s):**\n\n")
         
         for i, dup in enumerate(duplicates, 1):
-            response += f"{i}. **{dup['filename']}** (ID: {dup['document_id']})\n"
-            response += f"   • Max similarity: **{dup['max_similarity']:.1%}**\n"
-            response += f"   • Matching chunks: {dup['matching_chunks']}\n\n"
+            parts.append(f"{i}. **{dup['filename']}** (ID: {dup['document_id']})\n")
+            parts.append(f"   • Max similarity: **{dup['max_similarity']:.1%}**\n")
+            parts.append(f"   • Matching chunks: {dup['matching_chunks']}\n\n")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Duplicate detection failed: {e}")
@@ -836,27 +882,67 @@ async def find_duplicates_tool(arguments: dict) -> list[TextContent]:
 
 async def update_embeddings_tool(arguments: dict) -> list[TextContent]:
     """Update embeddings for all documents"""
+    try:
+        batch_size = int(arguments.get("batch_size", 32))
+    except (TypeError, ValueError):
+        return [TextContent(type="text", text="batch_size must be an integer between 1 and 256")]
+    # Clamp to the inputSchema range; range() rejects a zero step
+    batch_size = min(max(batch_size, 1), 256)
+    
     try:
         logger.info("Starting embedding update for all documents...")
         
         # Update embeddings
-        total_count = await update_all_embeddings()
+        total_count = await update_all_embeddings(batch_size=batch_size)
         
-        response = "✨ **Embedding Update Complete**\n\n"
+        parts: list[str] = ["✨ **Embedding Update Complete**\n\n"]
         
         if total_count == 0:
-            response += "All documents already have embeddings. No updates needed."
+            parts.append("All documents already have embeddings. No updates needed.")
         else:
-            response += f"Successfully generated **{total_count}** embeddings.\n"
-            response += "Vector search is now available for all processed documents."
+            parts.append(f"Successfully generated **{total_count}** embeddings.\n")
+            parts.append("Vector search is now available for all processed documents.")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Embedding update failed: {e}")
         return [TextContent(type="text", text=f"Embedding update failed: {str(e)}")]
 
 
+async def get_full_json_summary(document_id: int, updated_at: Optional[str]) -> Optional[dict]:
+    """
+    Project the summary fields of a document's full_text_json, cached by (document_id, updated_at)
+    
+    A single multi-path json_extract parses the blob once inside SQLite, so the
+    chunk embeddings are never materialized in Python.
+    """
+    key = (document_id, updated_at)
+    if key in _full_json_cache:
+        _full_json_cache.move_to_end(key)
+        return _full_json_cache[key]
+    
+    paths = ", ".join(f"'{path}'" for path in _FULL_JSON_SUMMARY_PATHS.values())
+    results = await execute_raw_sql(
+        f"SELECT json_extract(full_text_json, {paths}) AS summary FROM documents WHERE id = ?",
+        [document_id]
+    )
+    if not results or results[0]['summary'] is None:
+        return None
+    
+    # Drop missing fields so callers can rely on dict.get defaults
+    values = orjson.loads(results[0]['summary'])
+    summary = {
+        name: value
+        for name, value in zip(_FULL_JSON_SUMMARY_PATHS, values)
+        if value is not None
+    }
+    _full_json_cache[key] = summary
+    if len(_full_json_cache) > FULL_JSON_CACHE_SIZE:
+        _full_json_cache.popitem(last=False)
+    return summary
+
+
 async def get_document_json_tool(arguments: dict) -> list[TextContent]:
     """Get the full JSON representation of a document"""
     document_id = arguments.get("document_id")
@@ -865,9 +951,10 @@ async def get_document_json_tool(arguments: dict) -> list[TextContent]:
         return [TextContent(type="text", text="Document ID is required")]
     
     try:
-        # Query for full JSON data
+        # Query document info; the large full_text_json is only read on a cache miss
         query = """
-        SELECT id, filename, file_hash, full_text_json, content, uploaded_at
+        SELECT id, filename, file_hash, uploaded_at, updated_at,
+               full_text_json IS NOT NULL AS has_json
         FROM documents
         WHERE id = ?
         """
@@ -883,47 +970,46 @@ async def get_document_json_tool(arguments: dict) -> list[TextContent]:
         doc = results[0]
         
         # Format response
-        response = f"📋 **Document JSON Data**\n\n"
-        response += f"**ID:** {doc['id']}\n"
-        response += f"**Filename:** {doc['filename']}\n"
-        response += f"**File Hash:** {doc['file_hash'] or 'Not generated'}\n"
-        response += f"**Uploaded:** {doc['uploaded_at']}\n\n"
+        parts: list[str] = [f"📋 **Document JSON Data**\n\n"]
+        parts.append(f"**ID:** {doc['id']}\n")
+        parts.append(f"**Filename:** {doc['filename']}\n")
+        parts.append(f"**File Hash:** {doc['file_hash'] or 'Not generated'}\n")
+        parts.append(f"**Uploaded:** {doc['uploaded_at']}\n\n")
         
-        if doc['full_text_json']:
+        if doc['has_json']:
             try:
-                full_json = json.loads(doc['full_text_json']) if isinstance(doc['full_text_json'], str) else doc['full_text_json']
+                full_json = await get_full_json_summary(document_id, doc['updated_at'])
                 
                 # Show summary statistics
-                response += "**📊 JSON Statistics:**\n"
-                response += f"- Document Hash: {full_json.get('document_hash', 'N/A')[:16]}...\n"
-                response += f"- Content Length: {full_json.get('content_length', 0):,} characters\n"
-                response += f"- Chunks Count: {full_json.get('chunks_count', 0)}\n"
-                response += f"- Embedding Model: {full_json.get('embedding_model', 'N/A')}\n"
-                response += f"- Embedding Dimensions: {full_json.get('embedding_dimensions', 0)}\n\n"
+                parts.append("**📊 JSON Statistics:**\n")
+                parts.append(f"- Document Hash: {full_json.get('document_hash', 'N/A')[:16]}...\n")
+                parts.append(f"- Content Length: {full_json.get('content_length', 0):,} characters\n")
+                parts.append(f"- Chunks Count: {full_json.get('chunks_count', 0)}\n")
+                parts.append(f"- Embedding Model: {full_json.get('embedding_model', 'N/A')}\n")
+                parts.append(f"- Embedding Dimensions: {full_json.get('embedding_dimensions', 0)}\n\n")
                 
                 # Show metadata
                 if full_json.get('metadata'):
-                    response += "**🏷️ Metadata:**\n```json\n"
-                    response += json.dumps(full_json['metadata'], indent=2)[:500]
-                    response += "\n```\n\n"
+                    parts.append("**🏷️ Metadata:**\n```json\n")
+                    parts.append(orjson.dumps(full_json['metadata'], option=orjson.OPT_INDENT_2).decode()[:500])
+                    parts.append("\n```\n\n")
                 
                 # Show first chunk as sample
-                if full_json.get('chunks') and len(full_json['chunks']) > 0:
-                    first_chunk = full_json['chunks'][0]
-                    response += "**📄 First Chunk Sample:**\n"
-                    response += f"- Index: {first_chunk.get('index', 0)}\n"
-                    response += f"- Hash: {first_chunk.get('hash', 'N/A')[:16]}...\n"
-                    response += f"- Length: {first_chunk.get('length', 0)} characters\n"
-                    response += f"- Text Preview: {first_chunk.get('text', '')[:100]}...\n"
-                    response += f"- Embedding: [{first_chunk.get('embedding', [])[0]:.4f}, ...] (dim: {len(first_chunk.get('embedding', []))})\n"
+                if 'first_chunk_index' in full_json:
+                    parts.append("**📄 First Chunk Sample:**\n")
+                    parts.append(f"- Index: {full_json['first_chunk_index']}\n")
+                    parts.append(f"- Hash: {full_json.get('first_chunk_hash', 'N/A')[:16]}...\n")
+                    parts.append(f"- Length: {full_json.get('first_chunk_length', 0)} characters\n")
+                    parts.append(f"- Text Preview: {full_json.get('first_chunk_text', '')[:100]}...\n")
+                    parts.append(f"- Embedding: [{full_json['first_chunk_embedding']:.4f}, ...] (dim: {full_json.get('embedding_dimensions', 0)})\n")
                 
             except Exception as e:
                 logger.warning(f"Failed to parse full_text_json: {e}")
-                response += f"**Error parsing JSON:** {str(e)}\n"
+                parts.append(f"**Error parsing JSON:** {str(e)}\n")
         else:
-            response += "**No JSON data available** - Document may not have been fully processed yet.\n"
+            parts.append("**No JSON data available** - Document may not have been fully processed yet.\n")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Failed to get document JSON: {e}")
@@ -938,11 +1024,18 @@ async def check_duplicate_by_hash_tool(arguments: dict) -> list[TextContent]:
         return [TextContent(type="text", text="Document ID is required")]
     
     try:
-        # Get the hash of the specified document
+        # Fetch the document and all documents sharing its hash in one round-trip
         query = """
-        SELECT id, filename, file_hash, uploaded_at
-        FROM documents
-        WHERE id = ?
+        WITH target AS (
+            SELECT id, filename, file_hash
+            FROM documents
+            WHERE id = ?
+        )
+        SELECT t.filename AS target_filename, t.file_hash,
+               d.id, d.filename, d.uploaded_at, d.file_size, d.status
+        FROM target t
+        LEFT JOIN documents d ON d.file_hash = t.file_hash AND d.id != t.id
+        ORDER BY d.uploaded_at DESC
         """
         
         results = await execute_raw_sql(query, [document_id])
@@ -953,8 +1046,8 @@ async def check_duplicate_by_hash_tool(arguments: dict) -> list[TextContent]:
                 text=f"Document with ID {document_id} not found"
             )]
         
-        doc = results[0]
-        file_hash = doc['file_hash']
+        target_filename = results[0]['target_filename']
+        file_hash = results[0]['file_hash']
         
         if not file_hash:
             return [TextContent(
@@ -962,36 +1055,28 @@ async def check_duplicate_by_hash_tool(arguments: dict) -> list[TextContent]:
                 text=f"Document {document_id} does not have a hash generated yet"
             )]
         
-        # Find all documents with the same hash
-        duplicate_query = """
-        SELECT id, filename, uploaded_at, file_size, status
-        FROM documents
-        WHERE file_hash = ? AND id != ?
-        ORDER BY uploaded_at DESC
-        """
-        
-        duplicates = await execute_raw_sql(duplicate_query, [file_hash, document_id])
+        duplicates = [row for row in results if row['id'] is not None]
         
         # Format response
-        response = f"🔍 **Hash-Based Duplicate Check**\n\n"
-        response += f"**Document:** {doc['filename']} (ID: {document_id})\n"
-        response += f"**File Hash:** {file_hash[:16]}...\n\n"
+        parts: list[str] = [f"🔍 **Hash-Based Duplicate Check**\n\n"]
+        parts.append(f"**Document:** {target_filename} (ID: {document_id})\n")
+        parts.append(f"**File Hash:** {file_hash[:16]}...\n\n")
         
         if duplicates:
-            response += f"⚠️ **Found {len(duplicates)} exact duplicate(s):**\n\n"
+            parts.append(f"⚠️ **Found {len(duplicates)} exact duplicate(s):**\n\n")
             
             for i, dup in enumerate(duplicates, 1):
-                response += f"{i}. **{dup['filename']}** (ID: {dup['id']})\n"
-                response += f"   • Uploaded: {dup['uploaded_at']}\n"
-                response += f"   • Size: {dup['file_size']:,} bytes\n"
-                response += f"   • Status: {dup['status']}\n\n"
+                parts.append(f"{i}. **{dup['filename']}** (ID: {dup['id']})\n")
+                parts.append(f"   • Uploaded: {dup['uploaded_at']}\n")
+                parts.append(f"   • Size: {dup['file_size']:,} bytes\n")
+                parts.append(f"   • Status: {dup['status']}\n\n")
             
-            response += "💡 **Note:** These documents have identical content (same SHA-256 hash).\n"
+            parts.append("💡 **Note:** These documents have identical content (same SHA-256 hash).\n")
         else:
-            response += "✅ **No exact duplicates found.**\n"
-            response += "This document appears to be unique in the database.\n"
+            parts.append("✅ **No exact duplicates found.**\n")
+            parts.append("This document appears to be unique in the database.\n")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Duplicate check failed: {e}")
@@ -1018,46 +1103,58 @@ async def process_pending_documents_tool(arguments: dict) -> list[TextContent]:
                 text="✅ No pending documents to process. All documents are up to date."
             )]
         
-        response = f"📋 **Processing {len(pending_docs)} Pending Document(s)**\n\n"
+        parts: list[str] = [f"📋 **Processing {len(pending_docs)} Pending Document(s)**\n\n"]
+        
+        # Bound concurrency so extraction, embedding and DB writes overlap without thrashing
+        semaphore = asyncio.Semaphore(max(1, settings.doc_concurrency))
         
-        from app.services.document_processor import DocumentProcessor
-        processor = DocumentProcessor()
+        async def process_one(doc_id: int) -> bool:
+            async with semaphore:
+                return await document_processor.process_document_async(doc_id)
+        
+        results = await asyncio.gather(
+            *(process_one(doc['id']) for doc in pending_docs),
+            return_exceptions=True
+        )
+        
+        # Read back every final status in one round-trip; binding the ids as a
+        # single JSON array keeps one cached statement and no variable limit
+        status_rows = await execute_raw_sql(
+            "SELECT id, status FROM documents WHERE id IN (SELECT value FROM json_each(?))",
+            (orjson.dumps([doc['id'] for doc in pending_docs]).decode(),)
+        )
+        status_map = {row['id']: row['status'] for row in status_rows}
         
         success_count = 0
         fail_count = 0
         
-        for doc in pending_docs:
+        for doc, result in zip(pending_docs, results):
             doc_id = doc['id']
             filename = doc['filename']
             file_size = doc['file_size']
             
-            response += f"**Document {doc_id}:** {filename} ({file_size / 1024:.1f} KB)\n"
+            parts.append(f"**Document {doc_id}:** {filename} ({file_size / 1024:.1f} KB)\n")
             
-            try:
-                # Process the document
-                result = await processor.process_document_async(doc_id)
-                
-                if result:
-                    response += f"  ✅ Processed successfully\n"
-                    success_count += 1
-                else:
-                    response += f"  ❌ Processing failed\n"
-                    fail_count += 1
-                    
-            except Exception as e:
-                response += f"  ❌ Error: {str(e)}\n"
+            if isinstance(result, Exception):
+                parts.append(f"  ❌ Error: {str(result)}\n")
+                fail_count += 1
+                logger.error(f"Failed to process document {doc_id}: {result}")
+            elif result:
+                parts.append(f"  ✅ Processed successfully\n")
+                success_count += 1
+            else:
+                parts.append(f"  ❌ Processing failed (status: {status_map.get(doc_id, 'not found')})\n")
                 fail_count += 1
-                logger.error(f"Failed to process document {doc_id}: {e}")
         
-        response += f"\n**Summary:**\n"
-        response += f"- ✅ Successfully processed: {success_count}\n"
-        response += f"- ❌ Failed: {fail_count}\n"
-        response += f"- 📊 Total: {len(pending_docs)}\n"
+        parts.append(f"\n**Summary:**\n")
+        parts.append(f"- ✅ Successfully processed: {success_count}\n")
+        parts.append(f"- ❌ Failed: {fail_count}\n")
+        parts.append(f"- 📊 Total: {len(pending_docs)}\n")
         
         if success_count > 0:
-            response += f"\n💡 Processed documents are now searchable and ready for analysis."
+            parts.append(f"\n💡 Processed documents are now searchable and ready for analysis.")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Batch processing failed: {e}")
@@ -1067,10 +1164,21 @@ async def process_pending_documents_tool(arguments: dict) -> list[TextContent]:
         )]
 
 
+# Upload file types accepted by the MCP upload tool, mapped to their content types
+UPLOAD_CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "txt": "text/plain",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv"
+}
+
+
 async def upload_document_tool(arguments: dict) -> list[TextContent]:
     """Upload a document for processing"""
     import base64
     import hashlib
+    import secrets
     import uuid
     from pathlib import Path
     from datetime import datetime
@@ -1105,13 +1213,15 @@ async def upload_document_tool(arguments: dict) -> list[TextContent]:
                     text=f"❌ Error: File not found: {file_path}"
                 )]
             
+            # Size comes from stat so oversized files are rejected without reading them
             filename = path.name
-            file_content = path.read_bytes()
-            file_size = len(file_content)
+            file_content = None
+            file_size = path.stat().st_size
         else:
             # Decode base64 content
             try:
-                file_content = base64.b64decode(base64_content)
+                # Decode in a worker thread so large payloads don't block other tool calls
+                file_content = await asyncio.to_thread(base64.b64decode, base64_content)
                 file_size = len(file_content)
             except Exception as e:
                 return [TextContent(
@@ -1129,15 +1239,18 @@ async def upload_document_tool(arguments: dict) -> list[TextContent]:
         
         # Check file extension
         file_ext = Path(filename).suffix.lower().strip('.')
-        allowed_extensions = ["pdf", "docx", "txt", "xlsx", "csv"]
-        if file_ext not in allowed_extensions:
+        if file_ext not in UPLOAD_CONTENT_TYPES:
             return [TextContent(
                 type="text",
-                text=f"❌ Error: Unsupported file type '.{file_ext}'. Allowed types: {', '.join(allowed_extensions)}"
+                text=f"❌ Error: Unsupported file type '.{file_ext}'. Allowed types: {', '.join(UPLOAD_CONTENT_TYPES)}"
             )]
         
-        # Generate file hash
-        file_hash = hashlib.sha256(file_content).hexdigest()
+        # Generate file hash (off the event loop for large files); local files are
+        # hashed in streamed chunks rather than loaded whole
+        if file_content is None:
+            file_hash = await asyncio.to_thread(generate_file_hash, path, 1 << 20)
+        else:
+            file_hash = await asyncio.to_thread(lambda: hashlib.sha256(file_content).hexdigest())
         
         # Check for duplicates
         duplicate_query = """
@@ -1164,23 +1277,24 @@ async def upload_document_tool(arguments: dict) -> list[TextContent]:
         upload_dir = Path(os.getenv("UPLOAD_PATH", "./uploads"))
         upload_dir.mkdir(exist_ok=True)
         
-        # Generate unique filename
-        unique_id = str(uuid.uuid4())
-        safe_filename = f"{unique_id}_{filename}"
+        # Generate unique filename. The nanosecond time prefix keeps new uploads
+        # adjacent in directory listings; the random suffix keeps ids unique.
+        # documents.uuid keeps a real UUID
+        file_id = f"{time.time_ns():016x}{secrets.token_hex(6)}"
+        safe_filename = f"{file_id}_{filename}"
         file_path_full = upload_dir / safe_filename
         
-        # Write file
-        file_path_full.write_bytes(file_content)
+        # Write file off the event loop. Local files are copied in-kernel
+        # (shutil.copyfile uses sendfile on Linux) without entering Python memory
+        if file_content is None:
+            await asyncio.to_thread(shutil.copyfile, path, file_path_full)
+        else:
+            await asyncio.to_thread(file_path_full.write_bytes, file_content)
+            # Release the decoded payload before the (long) processing step
+            del file_content
         
         # Determine content type
-        content_type_map = {
-            "pdf": "application/pdf",
-            "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            "txt": "text/plain",
-            "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            "csv": "text/csv"
-        }
-        content_type = content_type_map.get(file_ext, "application/octet-stream")
+        content_type = UPLOAD_CONTENT_TYPES[file_ext]
         
         # Insert into database
         insert_query = """
@@ -1192,7 +1306,7 @@ async def upload_document_tool(arguments: dict) -> list[TextContent]:
         
         async with aiosqlite.connect(DATABASE_PATH) as db:
             cursor = await db.execute(insert_query, (
-                unique_id,
+                str(uuid.uuid4()),
                 safe_filename,
                 filename,
                 str(file_path_full),
@@ -1208,60 +1322,83 @@ async def upload_document_tool(arguments: dict) -> list[TextContent]:
         
         # Process document if requested
         if process_immediately:
-            # Import document processor
-            from app.services.document_processor import DocumentProcessor
-            processor = DocumentProcessor()
-            
             try:
-                # Process the document using the async wrapper
-                await processor.process_document_async(document_id)
+                # Process the document with the shared processor (its Docling
+                # converter is expensive to construct)
+                await document_processor.process_document_async(document_id)
                 
                 # Get updated status
                 status_query = "SELECT status FROM documents WHERE id = ?"
                 result = await execute_raw_sql(status_query, (document_id,))
                 status = result[0]['status'] if result else "unknown"
                 
-                response = f"✅ **Document Uploaded and Processed Successfully**\n\n"
-                response += f"- **Document ID:** {document_id}\n"
-                response += f"- **Filename:** {filename}\n"
-                response += f"- **Size:** {file_size / 1024:.1f} KB\n"
-                response += f"- **Type:** {file_ext.upper()}\n"
-                response += f"- **Category:** {category}\n"
-                response += f"- **Status:** {status}\n"
-                response += f"- **Hash:** {file_hash[:16]}...\n\n"
-                response += f"📝 Document has been processed and is ready for search and analysis."
+                parts: list[str] = [f"✅ **Document Uploaded and Processed Successfully**\n\n"]
+                parts.append(f"- **Document ID:** {document_id}\n")
+                parts.append(f"- **Filename:** {filename}\n")
+                parts.append(f"- **Size:** {file_size / 1024:.1f} KB\n")
+                parts.append(f"- **Type:** {file_ext.upper()}\n")
+                parts.append(f"- **Category:** {category}\n")
+                parts.append(f"- **Status:** {status}\n")
+                parts.append(f"- **Hash:** {file_hash[:16]}...\n\n")
+                parts.append(f"📝 Document has been processed and is ready for search and analysis.")
                 
             except Exception as e:
                 logger.error(f"Processing failed: {e}")
-                response = f"✅ **Document Uploaded Successfully**\n\n"
-                response += f"- **Document ID:** {document_id}\n"
-                response += f"- **Filename:** {filename}\n"
-                response += f"- **Size:** {file_size / 1024:.1f} KB\n\n"
-                response += f"⚠️ Processing failed: {str(e)}\n"
-                response += f"The document is uploaded but needs manual processing."
+                parts = [f"✅ **Document Uploaded Successfully**\n\n"]
+                parts.append(f"- **Document ID:** {document_id}\n")
+                parts.append(f"- **Filename:** {filename}\n")
+                parts.append(f"- **Size:** {file_size / 1024:.1f} KB\n\n")
+                parts.append(f"⚠️ Processing failed: {str(e)}\n")
+                parts.append(f"The document is uploaded but needs manual processing.")
         else:
-            response = f"✅ **Document Uploaded Successfully**\n\n"
-            response += f"- **Document ID:** {document_id}\n"
-            response += f"- **Filename:** {filename}\n"
-            response += f"- **Size:** {file_size / 1024:.1f} KB\n"
-            response += f"- **Type:** {file_ext.upper()}\n"
-            response += f"- **Category:** {category}\n"
-            response += f"- **Status:** uploaded (not processed)\n"
-            response += f"- **Hash:** {file_hash[:16]}...\n\n"
-            response += f"💡 Use `update_embeddings` to process this document later."
-        
-        return [TextContent(type="text", text=response)]
+            parts = [f"✅ **Document Uploaded Successfully**\n\n"]
+            parts.append(f"- **Document ID:** {document_id}\n")
+            parts.append(f"- **Filename:** {filename}\n")
+            parts.append(f"- **Size:** {file_size / 1024:.1f} KB\n")
+            parts.append(f"- **Type:** {file_ext.upper()}\n")
+            parts.append(f"- **Category:** {category}\n")
+            parts.append(f"- **Status:** uploaded (not processed)\n")
+            parts.append(f"- **Hash:** {file_hash[:16]}...\n\n")
+            parts.append(f"💡 Use `update_embeddings` to process this document later.")
+        
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
-        logger.error(f"Upload failed: {e}")
-        import traceback
-        traceback.print_exc()
+        # Traceback goes through the logging handler, not a blocking stderr write
+        logger.exception(f"Upload failed: {e}")
         return [TextContent(
             type="text",
             text=f"❌ Upload failed: {str(e)}"
         )]
 
 
+# Per-table projection of the extracted tables JSON. JSON1 truncates samples,
+# CSV/HTML and text in SQLite so large spreadsheets never reach Python whole.
+TABLE_SAMPLE_ROWS = 5
+
+_DOC_TABLES_SQL = f"""
+    SELECT
+        t.key AS position,
+        json_extract(t.value, '$.index') AS table_index,
+        json_extract(t.value, '$.caption') AS caption,
+        json_extract(t.value, '$.type') AS table_type,
+        json_quote(json_extract(t.value, '$.headers')) AS headers_json,
+        json_array_length(t.value, '$.rows') AS rows_count,
+        (SELECT json_group_array(r.value)
+         FROM json_each(t.value, '$.rows') r
+         WHERE r.key < {TABLE_SAMPLE_ROWS}) AS sample_rows_json,
+        substr(json_extract(t.value, '$.csv'), 1, 1000) AS csv,
+        length(json_extract(t.value, '$.csv')) AS csv_length,
+        substr(json_extract(t.value, '$.html'), 1, 1000) AS html,
+        length(json_extract(t.value, '$.html')) AS html_length,
+        substr(json_extract(t.value, '$.content'), 1, 500) AS content,
+        length(json_extract(t.value, '$.content')) AS content_length
+    FROM documents d, json_each(d.tables) t
+    WHERE d.id = ? AND json_type(d.tables) = 'array'
+    ORDER BY t.key
+"""
+
+
 async def get_document_tables_tool(arguments: dict) -> list[TextContent]:
     """Get extracted tables from a document"""
     document_id = arguments.get("document_id")
@@ -1271,9 +1408,10 @@ async def get_document_tables_tool(arguments: dict) -> list[TextContent]:
         return [TextContent(type="text", text="Document ID is required")]
     
     try:
-        # Query for document tables
+        # Query document state without loading the tables blob
         query = """
-        SELECT id, filename, tables, status, uploaded_at
+        SELECT id, filename, status, uploaded_at,
+               tables IS NOT NULL AND tables != '' AS has_tables
         FROM documents
         WHERE id = ?
         """
@@ -1296,120 +1434,142 @@ async def get_document_tables_tool(arguments: dict) -> list[TextContent]:
             )]
         
         # Format response
-        response = f"📊 **Document Tables**\n\n"
-        response += f"**Document:** {doc['filename']} (ID: {document_id})\n"
-        response += f"**Uploaded:** {doc['uploaded_at']}\n\n"
+        parts: list[str] = [f"📊 **Document Tables**\n\n"]
+        parts.append(f"**Document:** {doc['filename']} (ID: {document_id})\n")
+        parts.append(f"**Uploaded:** {doc['uploaded_at']}\n\n")
         
-        if not doc['tables']:
-            response += "📭 **No tables found in this document.**\n"
-            response += "Tables are automatically extracted from PDFs, Word docs, and other structured documents during processing.\n"
-            return [TextContent(type="text", text=response)]
+        if not doc['has_tables']:
+            parts.append("📭 **No tables found in this document.**\n")
+            parts.append("Tables are automatically extracted from PDFs, Word docs, and other structured documents during processing.\n")
+            return [TextContent(type="text", text="".join(parts))]
         
         try:
-            # Parse tables JSON
-            tables = json.loads(doc['tables']) if isinstance(doc['tables'], str) else doc['tables']
+            # Project table summaries (malformed JSON raises here)
+            tables = await execute_raw_sql(_DOC_TABLES_SQL, [document_id])
             
-            if not tables or (isinstance(tables, list) and len(tables) == 0):
-                response += "📭 **No tables found in this document.**\n"
-                return [TextContent(type="text", text=response)]
+            if not tables:
+                parts.append("📭 **No tables found in this document.**\n")
+                return [TextContent(type="text", text="".join(parts))]
             
-            response += f"**Found {len(tables)} table(s):**\n\n"
+            parts.append(f"**Found {len(tables)} table(s):**\n\n")
             
             # Format tables based on requested format
             for idx, table in enumerate(tables):
-                response += f"### 📋 Table {idx + 1}\n"
+                parts.append(f"### 📋 Table {idx + 1}\n")
+                
+                headers = orjson.loads(table['headers_json'])
+                rows = orjson.loads(table['sample_rows_json'])
+                rows_count = table['rows_count'] or 0
                 
                 # Add caption if available
-                if table.get('caption'):
-                    response += f"**Caption:** {table['caption']}\n"
+                if table['caption']:
+                    parts.append(f"**Caption:** {table['caption']}\n")
                 
                 if format_type == "json":
                     # JSON format - show structure
-                    response += "```json\n"
+                    parts.append("```json\n")
                     # Show a condensed version of the table
                     table_summary = {
-                        "index": table.get('index', idx),
-                        "rows_count": len(table.get('rows', [])),
-                        "has_headers": bool(table.get('headers')),
-                        "type": table.get('type', 'extracted_table')
+                        "index": table['position'] if table['table_index'] is None else table['table_index'],
+                        "rows_count": rows_count,
+                        "has_headers": bool(headers),
+                        "type": table['table_type'] or 'extracted_table'
                     }
-                    if table.get('headers'):
-                        table_summary['headers'] = table['headers']
-                    if table.get('rows') and len(table['rows']) > 0:
+                    if headers:
+                        table_summary['headers'] = headers
+                    if rows:
                         # Show first 3 rows as sample
-                        table_summary['sample_rows'] = table['rows'][:3]
+                        table_summary['sample_rows'] = rows[:3]
                     
-                    response += json.dumps(table_summary, indent=2)
-                    response += "\n```\n"
+                    parts.append(orjson.dumps(table_summary, option=orjson.OPT_INDENT_2).decode())
+                    parts.append("\n```\n")
                     
                 elif format_type == "csv":
                     # CSV format
-                    if table.get('csv'):
-                        response += "```csv\n"
-                        response += table['csv'][:1000]  # Limit to first 1000 chars
-                        if len(table.get('csv', '')) > 1000:
-                            response += "\n... (truncated)"
-                        response += "\n```\n"
-                    elif table.get('rows'):
+                    if table['csv']:
+                        parts.append("```csv\n")
+                        parts.append(table['csv'])  # Limited to first 1000 chars in SQL
+                        if table['csv_length'] > 1000:
+                            parts.append("\n... (truncated)")
+                        parts.append("\n```\n")
+                    elif rows:
                         # Convert rows to CSV format
-                        response += "```csv\n"
-                        if table.get('headers'):
-                            response += ",".join(str(h) for h in table['headers']) + "\n"
-                        for row in table.get('rows', [])[:5]:  # Show first 5 rows
+                        parts.append("```csv\n")
+                        if headers:
+                            parts.append(",".join(str(h) for h in headers) + "\n")
+                        for row in rows:  # Show first 5 rows
                             if isinstance(row, list):
-                                response += ",".join(str(cell) for cell in row) + "\n"
+                                parts.append(",".join(str(cell) for cell in row) + "\n")
                             elif isinstance(row, dict):
-                                response += ",".join(str(v) for v in row.values()) + "\n"
-                        if len(table.get('rows', [])) > 5:
-                            response += "... (showing first 5 rows)\n"
-                        response += "```\n"
+                                parts.append(",".join(str(v) for v in row.values()) + "\n")
+                        if rows_count > 5:
+                            parts.append("... (showing first 5 rows)\n")
+                        parts.append("```\n")
                     
                 elif format_type == "html":
                     # HTML format
-                    if table.get('html'):
-                        response += "```html\n"
-                        response += table['html'][:1000]  # Limit to first 1000 chars
-                        if len(table.get('html', '')) > 1000:
-                            response += "\n... (truncated)"
-                        response += "\n```\n"
+                    if table['html']:
+                        parts.append("```html\n")
+                        parts.append(table['html'])  # Limited to first 1000 chars in SQL
+                        if table['html_length'] > 1000:
+                            parts.append("\n... (truncated)")
+                        parts.append("\n```\n")
                     else:
-                        response += "HTML format not available for this table.\n"
+                        parts.append("HTML format not available for this table.\n")
                 
                 else:  # text format
                     # Simple text representation
-                    if table.get('content'):
-                        response += table['content'][:500]
-                        if len(table.get('content', '')) > 500:
-                            response += "... (truncated)"
-                        response += "\n"
-                    elif table.get('rows'):
+                    if table['content']:
+                        parts.append(table['content'])  # Limited to first 500 chars in SQL
+                        if table['content_length'] > 500:
+                            parts.append("... (truncated)")
+                        parts.append("\n")
+                    elif rows:
                         # Show rows as text
-                        for i, row in enumerate(table.get('rows', [])[:5]):
-                            response += f"Row {i+1}: {row}\n"
-                        if len(table.get('rows', [])) > 5:
-                            response += f"... and {len(table['rows']) - 5} more rows\n"
+                        for i, row in enumerate(rows):
+                            parts.append(f"Row {i+1}: {row}\n")
+                        if rows_count > 5:
+                            parts.append(f"... and {rows_count - 5} more rows\n")
                 
-                response += "\n"
+                parts.append("\n")
             
             # Add extraction tips
-            response += "\n💡 **Tips:**\n"
-            response += "- Tables are automatically extracted from PDFs, Word docs, and Excel files\n"
-            response += "- Use format='csv' to get comma-separated values\n"
-            response += "- Use format='json' to get structured data\n"
-            response += "- Complex tables with merged cells may need manual review\n"
+            parts.append("\n💡 **Tips:**\n")
+            parts.append("- Tables are automatically extracted from PDFs, Word docs, and Excel files\n")
+            parts.append("- Use format='csv' to get comma-separated values\n")
+            parts.append("- Use format='json' to get structured data\n")
+            parts.append("- Complex tables with merged cells may need manual review\n")
             
         except Exception as e:
             logger.warning(f"Failed to parse tables JSON: {e}")
-            response += f"⚠️ **Error parsing table data:** {str(e)}\n"
-            response += "The tables data may be corrupted or in an unexpected format.\n"
+            parts.append(f"⚠️ **Error parsing table data:** {str(e)}\n")
+            parts.append("The tables data may be corrupted or in an unexpected format.\n")
         
-        return [TextContent(type="text", text=response)]
+        return [TextContent(type="text", text="".join(parts))]
         
     except Exception as e:
         logger.error(f"Failed to get document tables: {e}")
         return [TextContent(type="text", text=f"Failed to retrieve document tables: {str(e)}")]
 
 
+# Tool name -> implementation, resolved once instead of walking an if/elif chain per call
+TOOL_HANDLERS = {
+    "search_documents": search_documents_tool,
+    "get_document_details": get_document_details_tool,
+    "get_document_statistics": get_document_statistics_tool,
+    "analyze_document_content": analyze_document_content_tool,
+    "get_system_health": get_system_health_tool,
+    "vector_search": vector_search_tool,
+    "find_duplicates": find_duplicates_tool,
+    "update_embeddings": update_embeddings_tool,
+    "get_document_json": get_document_json_tool,
+    "check_duplicate_by_hash": check_duplicate_by_hash_tool,
+    "get_document_tables": get_document_tables_tool,
+    "upload_document": upload_document_tool,
+    "process_pending_documents": process_pending_documents_tool,
+}
+
+
 async def main():
     """Main entry point for MCP server"""
     logger.info("🚀 Starting Kansofy-Trade MCP Server")
@@ -1427,13 +1587,21 @@ async def main():
     logger.info("✅ Vector store initialized")
     
     # Start MCP server
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            server.create_initialization_options()
-        )
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                server.create_initialization_options()
+            )
+    finally:
+        await close_raw_connection()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # uvloop ships with uvicorn[standard] on POSIX; uvloop.run needs uvloop>=0.18,
+    # so older installs and other platforms fall back to the stock loop
+    if uvloop is not None and hasattr(uvloop, "run"):
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file
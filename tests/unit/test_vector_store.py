@@ -0,0 +1,114 @@
+"""Tests for the sqlite-vec search path in app.core.vector_store."""
+
+import aiosqlite
+import numpy as np
+import pytest
+import pytest_asyncio
+
+pytest.importorskip("sqlite_vec")
+pytest.importorskip("sentence_transformers")
+
+from app.core import vector_store  # noqa: E402
+
+DOCUMENTS_SCHEMA = """
+CREATE TABLE documents (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    content TEXT,
+    file_hash TEXT,
+    full_text_json TEXT,
+    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP
+);
+"""
+
+
+def _unit(vec: np.ndarray) -> np.ndarray:
+    return (vec / np.linalg.norm(vec)).astype(np.float32)
+
+
+class _FakeModel:
+    """Returns a fixed query embedding instead of running the transformer."""
+
+    def __init__(self, embedding: np.ndarray):
+        self.embedding = embedding
+
+    def encode(self, text, convert_to_numpy=True):
+        return self.embedding
+
+
+class TestVecSearch:
+    """KNN search must return live hits even when stale chunks rank first."""
+
+    @pytest_asyncio.fixture
+    async def vec_db(self, tmp_path, monkeypatch):
+        """Create a database with three embedded documents."""
+        db_path = tmp_path / "test.db"
+        monkeypatch.setattr(vector_store.settings, "database_path", str(db_path))
+
+        async with aiosqlite.connect(db_path) as db:
+            await db.executescript(DOCUMENTS_SCHEMA)
+            await db.executemany(
+                "INSERT INTO documents (id, filename, status, content) VALUES (?, ?, 'completed', ?)",
+                [(i, f"doc{i}.txt", f"document {i}") for i in (1, 2, 3)]
+            )
+            await db.commit()
+
+        await vector_store.init_vector_store()
+        if not vector_store.vec_enabled:
+            pytest.skip("sqlite-vec extension could not be loaded")
+
+        rng = np.random.default_rng(0)
+        query = _unit(np.eye(vector_store.EMBEDDING_DIMENSIONS)[0])
+
+        # Documents 1 and 2 sit right on the query; document 3 is further away
+        for document_id, spread, count in ((1, 0.01, 12), (2, 0.01, 12), (3, 0.3, 4)):
+            embeddings = np.stack([
+                _unit(query + spread * rng.standard_normal(query.shape))
+                for _ in range(count)
+            ])
+            chunks = [f"document {document_id} chunk {i}" for i in range(count)]
+            await vector_store.store_document_embeddings(
+                document_id, f"document {document_id}", chunks, embeddings
+            )
+
+        monkeypatch.setattr(vector_store, "get_embedding_model", lambda: _FakeModel(query))
+        return db_path
+
+    @pytest.mark.asyncio
+    async def test_search_skips_deleted_and_unfinished_documents(self, vec_db):
+        """Test that stale candidates do not shrink the result set."""
+        # Arrange: delete document 1 without cleanup and mark document 2 unfinished
+        async with aiosqlite.connect(vec_db) as db:
+            await db.execute("DELETE FROM documents WHERE id = 1")
+            await db.execute("UPDATE documents SET status = 'processing' WHERE id = 2")
+            await db.commit()
+
+        # Act
+        results = await vector_store.search_similar_documents("query", limit=3, threshold=0.0)
+
+        # Assert
+        assert len(results) == 3
+        assert {result['document_id'] for result in results} == {3}
+
+    @pytest.mark.asyncio
+    async def test_delete_document_embeddings(self, vec_db):
+        """Test that deleting a document removes its chunks from search."""
+        # Arrange
+        async with aiosqlite.connect(vec_db) as db:
+            await db.execute("DELETE FROM documents WHERE id = 1")
+            await db.commit()
+
+        # Act
+        await vector_store.delete_document_embeddings(1)
+        results = await vector_store.search_similar_documents("query", limit=5, threshold=0.0)
+
+        # Assert
+        assert len(results) == 5
+        assert 1 not in {result['document_id'] for result in results}
+        async with aiosqlite.connect(vec_db) as db:
+            cursor = await db.execute(
+                "SELECT COUNT(*) FROM document_embeddings WHERE document_id = 1"
+            )
+            assert (await cursor.fetchone())[0] == 0